@@ -0,0 +1,173 @@
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+import argparse_utils as apu
+from constants import CACHE_PATH
+from function import Function
+from linear_sweep import sweep_functions
+from rom import Rom
+from thumb import ThumbForm
+
+
+ANALYSIS_SOURCES = (
+    "analysis_cache.py", "function.py", "linear_sweep.py", "rom.py", "thumb.py"
+)
+"""Source files whose contents affect analysis results."""
+
+
+class RomAnalysis(object):
+    """
+    Function boundaries, instruction formats, data pools, jump tables, and
+    bl calls of every THUMB function in a ROM. Per function values are
+    stored as flat arrays, where the values of function i are in
+    [*_idxs[i], *_idxs[i + 1]).
+    """
+
+    FIELDS = (
+        "func_starts", "func_ends",
+        "inst_idxs", "inst_addrs", "inst_forms",
+        "pool_idxs", "pool_addrs",
+        "jump_idxs", "jump_addrs",
+        "bl_idxs", "bl_addrs", "bl_targets"
+    )
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self.func_starts: np.ndarray = arrays["func_starts"]
+        self.func_ends: np.ndarray = arrays["func_ends"]
+        self.inst_idxs: np.ndarray = arrays["inst_idxs"]
+        self.inst_addrs: np.ndarray = arrays["inst_addrs"]
+        self.inst_forms: np.ndarray = arrays["inst_forms"]
+        self.pool_idxs: np.ndarray = arrays["pool_idxs"]
+        self.pool_addrs: np.ndarray = arrays["pool_addrs"]
+        self.jump_idxs: np.ndarray = arrays["jump_idxs"]
+        self.jump_addrs: np.ndarray = arrays["jump_addrs"]
+        self.bl_idxs: np.ndarray = arrays["bl_idxs"]
+        self.bl_addrs: np.ndarray = arrays["bl_addrs"]
+        self.bl_targets: np.ndarray = arrays["bl_targets"]
+
+    def __len__(self) -> int:
+        return len(self.func_starts)
+
+    @classmethod
+    def from_functions(cls, funcs: list[Function]) -> "RomAnalysis":
+        lists: dict[str, list[int]] = {f: [] for f in cls.FIELDS}
+        for func in funcs:
+            lists["func_starts"].append(func.start_addr)
+            lists["func_ends"].append(func.end_addr)
+            lists["inst_idxs"].append(len(lists["inst_addrs"]))
+            lists["pool_idxs"].append(len(lists["pool_addrs"]))
+            lists["jump_idxs"].append(len(lists["jump_addrs"]))
+            lists["bl_idxs"].append(len(lists["bl_addrs"]))
+            for addr, inst in func.instructs.items():
+                lists["inst_addrs"].append(addr)
+                lists["inst_forms"].append(inst.format.value)
+                if inst.format == ThumbForm.Link:
+                    lists["bl_addrs"].append(addr)
+                    lists["bl_targets"].append(inst.branch_addr())
+            lists["pool_addrs"] += sorted(func.data_pool)
+            lists["jump_addrs"] += sorted(func.get_jump_tables())
+        for field in ("inst_idxs", "pool_idxs", "jump_idxs", "bl_idxs"):
+            addrs_field = field.replace("_idxs", "_addrs")
+            lists[field].append(len(lists[addrs_field]))
+        arrays = {f: np.array(v, dtype=np.int64) for f, v in lists.items()}
+        arrays["inst_forms"] = arrays["inst_forms"].astype(np.uint8)
+        return cls(arrays)
+
+    @classmethod
+    def from_rom(cls, rom: Rom) -> "RomAnalysis":
+        return cls(sweep_functions(rom))
+
+    @classmethod
+    def load(cls, path: str) -> "RomAnalysis":
+        with np.load(path) as npz:
+            return cls({f: npz[f] for f in cls.FIELDS})
+
+    def save(self, path: str) -> None:
+        # Write to a temporary file first so readers never see partial files
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, **{f: getattr(self, f) for f in self.FIELDS})
+        os.replace(temp_path, path)
+
+    def func_range(self, i: int) -> tuple[int, int]:
+        return int(self.func_starts[i]), int(self.func_ends[i])
+
+    def func_pools(self, i: int) -> np.ndarray:
+        return self.pool_addrs[self.pool_idxs[i]:self.pool_idxs[i + 1]]
+
+    def func_jumps(self, i: int) -> np.ndarray:
+        return self.jump_addrs[self.jump_idxs[i]:self.jump_idxs[i + 1]]
+
+    def func_bls(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (addresses, targets) of each bl in the function."""
+        s = slice(self.bl_idxs[i], self.bl_idxs[i + 1])
+        return self.bl_addrs[s], self.bl_targets[s]
+
+    def external_bls(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (addresses, targets) of each bl to outside its function."""
+        counts = np.diff(self.bl_idxs)
+        starts = np.repeat(self.func_starts, counts)
+        ends = np.repeat(self.func_ends, counts)
+        targets = self.bl_targets
+        is_ext = (targets < starts) | (targets >= ends)
+        return self.bl_addrs[is_ext], targets[is_ext]
+
+
+def analysis_version() -> str:
+    """Returns a hash of the source files used for analysis."""
+    sha = hashlib.sha1()
+    tools_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in ANALYSIS_SOURCES:
+        with open(os.path.join(tools_dir, name), "rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:16]
+
+
+def cache_path(rom: Rom) -> str:
+    """Returns the cache file path for the ROM and current analysis code."""
+    rom_hash = hashlib.sha1(rom.data).hexdigest()
+    return os.path.join(CACHE_PATH, f"{rom_hash}_{analysis_version()}.npz")
+
+
+def get_analysis(rom: Rom, use_cache: bool = True) -> RomAnalysis:
+    """
+    Returns the analysis of every THUMB function in the ROM, loading it
+    from the cache if present and saving it otherwise.
+    """
+    if not use_cache:
+        return RomAnalysis.from_rom(rom)
+    path = cache_path(rom)
+    if os.path.isfile(path):
+        try:
+            return RomAnalysis.load(path)
+        except (OSError, KeyError, ValueError):
+            # Corrupted or outdated file; reanalyze
+            pass
+    analysis = RomAnalysis.from_rom(rom)
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    analysis.save(path)
+    return analysis
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    apu.add_arg(parser, apu.ArgType.ROM_PATH)
+    parser.add_argument("-r", "--rebuild", action="store_true",
+        help="Reanalyze the ROM even if it's cached")
+
+    args = parser.parse_args()
+    rom = apu.get_rom(args.rom_path)
+    if args.rebuild:
+        analysis = RomAnalysis.from_rom(rom)
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        analysis.save(cache_path(rom))
+    else:
+        analysis = get_analysis(rom)
+    print(f"Functions:\t{len(analysis)}")
+    print(f"Instructions:\t{len(analysis.inst_addrs)}")
+    print(f"Pool words:\t{len(analysis.pool_addrs)}")
+    print(f"Jump words:\t{len(analysis.jump_addrs)}")
+    print(f"Calls:\t{len(analysis.bl_addrs)}")
@@ -25,9 +25,9 @@ def add_arg(parser: ArgumentParser, arg_type: ArgType, *name_or_flags: str):
     parser.add_argument(*name_or_flags, type=type, help=help)
 
 
-def get_rom(rom_path: str) -> Rom:
+def get_rom(rom_path: str, mapped: bool = True) -> Rom:
     try:
-        return Rom(rom_path)
+        return Rom(rom_path, mapped)
     except:
         raise ValueError(f"Could not open rom at {rom_path}")
 
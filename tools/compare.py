@@ -1,7 +1,8 @@
 import argparse
 
 import argparse_utils as apu
-from compress import decomp_rle
+from decomp_cache import decompress
+from info.info_entry import Compression
 from rom import Rom
 
 
@@ -12,8 +13,8 @@ def compare_block_bg(rom_1: Rom, rom_2: Rom, addr_1: int, addr_2: int) -> None:
     height_2 = rom_2.read_8(addr_2 + 1)
     if width_1 != width_2 or height_1 != height_2:
         print(f"Different dimensions: {width_1}, {height_1} and {width_2}, {height_2}")
-    blocks_1, _ = decomp_rle(rom_1.data, addr_1 + 2)
-    blocks_2, _ = decomp_rle(rom_2.data, addr_2 + 2)
+    blocks_1, _ = decompress(rom_1, addr_1 + 2, Compression.RLE)
+    blocks_2, _ = decompress(rom_2, addr_2 + 2, Compression.RLE)
     if len(blocks_1) != len(blocks_2):
         raise ValueError("Decompressed data lengths are different")
     if len(blocks_1) != width_1 * height_1 * 2:
@@ -1,6 +1,8 @@
 import argparse
+from collections.abc import Generator
 from enum import Enum, auto
 import heapq
+from typing import Optional
 
 import argparse_utils as apu
 
@@ -9,6 +11,11 @@ MIN_MATCH_SIZE = 3
 MIN_WINDOW_SIZE = 1
 MAX_MATCH_SIZE = (1 << 4) - 1 + MIN_MATCH_SIZE
 MAX_WINDOW_SIZE = (1 << 12) - 1 + MIN_WINDOW_SIZE
+MAX_CHAIN_DEPTH = 128
+"""Default maximum number of earlier positions GREEDY checks for a match.
+A depth of MAX_WINDOW_SIZE checks every position in the window."""
+STREAM_CHUNK_SIZE = 0x400
+"""Number of bytes streaming decoders try to yield at a time."""
 
 
 class LzCompMethod(Enum):
@@ -16,59 +23,95 @@ class LzCompMethod(Enum):
     MATCHING = auto()
     GREEDY = auto()
     OPTIMAL = auto()
+    OPTIMAL_DP = auto()
 
 
 def decomp_rle(input: bytes, idx: int) -> tuple[bytes, int]:
     src_start = idx
-    passes = []
-    half = None
-    # For each pass
-    for p in range(2):
-        if p == 1:
-            half = len(passes)
-        num_bytes = input[idx]
-        idx += 1
-        flag = 0x80 if num_bytes == 1 else 0x8000
-        while True:
-            amount = None
-            if num_bytes == 1:
-                amount = input[idx]
-            else:
-                # num_bytes == 2
-                amount = (input[idx] << 8) | input[idx + 1]
-            idx += num_bytes
-
-            if amount == 0:
-                break
+    # Each pass has every other byte of output
+    pass_1, idx = read_stream(_stream_rle_pass(input, idx))
+    pass_2, idx = read_stream(_stream_rle_pass(input, idx))
 
-            if (amount & flag) != 0:
-                # Compressed
-                amount %= flag
-                val = input[idx]
-                idx += 1
-                while amount > 0:
-                    passes.append(val)
-                    amount -= 1
-            else:
-                # Uncompressed
-                while amount > 0:
-                    passes.append(input[idx])
-                    idx +=1
-                    amount -=1
-    
     # Each pass must be equal length
-    if len(passes) != half * 2:
+    if len(pass_1) != len(pass_2):
         raise ValueError()
-    
+
     # Combine passes to get output
-    out_list = bytearray()
-    for i in range(half):
-        out_list.append(passes[i])
-        out_list.append(passes[half + i])
-    
+    output = bytearray(len(pass_1) * 2)
+    output[0::2] = pass_1
+    output[1::2] = pass_2
+
     # Return bytes and compressed size
     comp_size = idx - src_start
-    return bytes(out_list), comp_size
+    return bytes(output), comp_size
+
+
+def comp_rle(input: bytes) -> bytes:
+    """
+    RLE compresses data in two passes, the first with every even byte and the
+    second with every odd byte.
+    """
+    if len(input) % 2 != 0:
+        raise ValueError("Data length must be even")
+    output = bytearray()
+    for data in (input[0::2], input[1::2]):
+        # Use whichever size of run lengths is smaller
+        pass_1 = _comp_rle_pass(data, 1)
+        pass_2 = _comp_rle_pass(data, 2)
+        output += pass_1 if len(pass_1) <= len(pass_2) else pass_2
+    return bytes(output)
+
+
+def _comp_rle_pass(data: bytes, num_bytes: int) -> bytearray:
+    flag = 0x80 if num_bytes == 1 else 0x8000
+    max_amount = flag - 1
+    # Runs shorter than this are cheaper to leave uncompressed
+    min_run = num_bytes + 2
+    length = len(data)
+    output = bytearray((num_bytes,))
+
+    def add_amount(amount: int) -> None:
+        output.extend(amount.to_bytes(num_bytes, "big"))
+
+    idx = 0
+    lit_start = 0
+    while idx < length:
+        # Find length of run at current position
+        val = data[idx]
+        end = idx + 1
+        while end < length and data[end] == val:
+            end += 1
+        if end - idx < min_run:
+            idx = end
+            continue
+        # Uncompressed bytes before run
+        while lit_start < idx:
+            amount = min(idx - lit_start, max_amount)
+            add_amount(amount)
+            output += data[lit_start:lit_start + amount]
+            lit_start += amount
+        # Compressed
+        while idx < end:
+            amount = min(end - idx, max_amount)
+            add_amount(flag | amount)
+            output.append(val)
+            idx += amount
+        lit_start = idx
+    # Uncompressed bytes at end
+    while lit_start < length:
+        amount = min(length - lit_start, max_amount)
+        add_amount(amount)
+        output += data[lit_start:lit_start + amount]
+        lit_start += amount
+    add_amount(0)
+    return output
+
+
+_FLAG_TOKENS = tuple(
+    tuple((flag << i) & 0x80 != 0 for i in range(8))
+    for flag in range(0x100)
+)
+"""For each flag byte, whether each of the next 8 tokens is compressed."""
 
 
 def decomp_lz77(input: bytes, idx: int) -> tuple[bytes, int]:
@@ -77,13 +120,13 @@ def decomp_lz77(input: bytes, idx: int) -> tuple[bytes, int]:
         raise ValueError("Missing 0x10 flag")
 
     # Get length of decompressed data
-    remain = input[idx + 1] | (input[idx + 2] << 8) | (input[idx + 3] << 16)
-    output = bytearray([0] * remain)
+    length = input[idx + 1] | (input[idx + 2] << 8) | (input[idx + 3] << 16)
 
     # Check for valid data size
-    if remain == 0:
+    if length == 0:
         raise ValueError("Invalid data size")
 
+    output = bytearray(length)
     start = idx
     idx += 4
     dst = 0
@@ -93,30 +136,47 @@ def decomp_lz77(input: bytes, idx: int) -> tuple[bytes, int]:
         cflag = input[idx]
         idx += 1
 
-        for _ in range(8):
-            if (cflag & 0x80) == 0:
+        if cflag == 0 and dst + 8 <= length:
+            # 8 uncompressed bytes
+            chunk = input[idx:idx + 8]
+            if len(chunk) != 8:
+                raise IndexError("Unexpected end of input")
+            output[dst:dst + 8] = chunk
+            idx += 8
+            dst += 8
+            if dst == length:
+                return bytes(output), idx - start
+            continue
+
+        for compressed in _FLAG_TOKENS[cflag]:
+            if not compressed:
                 # Uncompressed
                 output[dst] = input[idx]
                 idx += 1
                 dst += 1
-                remain -= 1
             else:
                 # Compressed
-                amount_to_copy = (input[idx] >> 4) + MIN_MATCH_SIZE
-                window = ((input[idx] & 0xF) << 8) + input[idx + 1] + MIN_WINDOW_SIZE
+                val = input[idx]
+                amount_to_copy = (val >> 4) + MIN_MATCH_SIZE
+                window = ((val & 0xF) << 8) + input[idx + 1] + MIN_WINDOW_SIZE
                 idx += 2
-                remain -= amount_to_copy
-                
-                for _ in range(amount_to_copy):
-                    output[dst] = output[dst - window]
-                    dst += 1
-
-            if remain <= 0:
-                if remain < 0:
+                end = dst + amount_to_copy
+                if end > length:
                     raise ValueError("Too many bytes copied at end")
+                src = dst - window
+                if src < 0:
+                    raise ValueError("Window starts before output")
+                if window >= amount_to_copy:
+                    output[dst:end] = output[src:src + amount_to_copy]
+                else:
+                    # Overlapping, so repeat the window
+                    reps = -(-amount_to_copy // window)
+                    output[dst:end] = (output[src:dst] * reps)[:amount_to_copy]
+                dst = end
+
+            if dst == length:
                 comp_size = idx - start
                 return bytes(output), comp_size
-            cflag <<= 1
 
 
 def is_lz77(input: bytes, idx: int) -> int:
@@ -165,20 +225,235 @@ def is_lz77(input: bytes, idx: int) -> int:
             cflag <<= 1
 
 
-def comp_lz77(input: bytes, method: LzCompMethod = LzCompMethod.GREEDY) -> bytes:
-    if method == LzCompMethod.MATCHING or method == LzCompMethod.GREEDY:
-        matching = method == LzCompMethod.MATCHING
-        return _comp_lz77_greedy(input, matching)
-    elif method == LzCompMethod.OPTIMAL:
-        return _comp_lz77_optimal(input)
+def stream_lz77(
+    input: bytes,
+    idx: int,
+    max_size: int = None
+) -> Generator[bytes, None, int]:
+    """
+    Decompresses LZ77 data, yielding the output in chunks. Stops after
+    max_size bytes if provided. Returns the compressed size if all the data
+    was decompressed.
+    """
+    # Check for 0x10 flag
+    if input[idx] != 0x10:
+        raise ValueError("Missing 0x10 flag")
+
+    # Get length of decompressed data
+    length = input[idx + 1] | (input[idx + 2] << 8) | (input[idx + 3] << 16)
+
+    # Check for valid data size
+    if length == 0:
+        raise ValueError("Invalid data size")
+    if max_size is None or max_size > length:
+        max_size = length
 
+    start = idx
+    idx += 4
+    # Only the bytes a match can copy from are kept between chunks
+    buf = bytearray()
+    flushed = 0
+    dst = 0
+
+    while dst < max_size:
+        cflag = input[idx]
+        idx += 1
 
-def _comp_lz77_greedy(input: bytes, matching: bool) -> bytes:
+        for compressed in _FLAG_TOKENS[cflag]:
+            if not compressed:
+                # Uncompressed
+                buf.append(input[idx])
+                idx += 1
+                dst += 1
+            else:
+                # Compressed
+                val = input[idx]
+                amount_to_copy = (val >> 4) + MIN_MATCH_SIZE
+                window = ((val & 0xF) << 8) + input[idx + 1] + MIN_WINDOW_SIZE
+                idx += 2
+                if dst + amount_to_copy > length:
+                    raise ValueError("Too many bytes copied at end")
+                if window > dst:
+                    raise ValueError("Window starts before output")
+                src = len(buf) - window
+                if window >= amount_to_copy:
+                    buf += buf[src:src + amount_to_copy]
+                else:
+                    # Overlapping, so repeat the window
+                    reps = -(-amount_to_copy // window)
+                    buf += (buf[src:] * reps)[:amount_to_copy]
+                dst += amount_to_copy
+
+            if dst >= max_size:
+                break
+
+        if dst >= max_size or len(buf) - flushed >= STREAM_CHUNK_SIZE:
+            # Yield new bytes and drop any outside the window
+            end = len(buf) - (dst - max_size) if dst > max_size else len(buf)
+            yield bytes(buf[flushed:end])
+            del buf[:-MAX_WINDOW_SIZE]
+            flushed = len(buf)
+
+    if max_size < length:
+        return None
+    return idx - start
+
+
+def _stream_rle_pass(input: bytes, idx: int) -> Generator[bytes, None, int]:
+    """Yields each run of one RLE pass. Returns the index after the pass."""
+    num_bytes = input[idx]
+    idx += 1
+    flag = 0x80 if num_bytes == 1 else 0x8000
+    while True:
+        if num_bytes == 1:
+            amount = input[idx]
+        else:
+            # num_bytes == 2
+            amount = (input[idx] << 8) | input[idx + 1]
+        idx += num_bytes
+
+        if amount == 0:
+            return idx
+
+        if (amount & flag) != 0:
+            # Compressed
+            amount %= flag
+            yield bytes((input[idx],)) * amount
+            idx += 1
+        else:
+            # Uncompressed
+            yield bytes(input[idx:idx + amount])
+            idx += amount
+
+
+def _skip_rle_pass(input: bytes, idx: int) -> int:
+    """Returns the index after an RLE pass without decompressing it."""
+    num_bytes = input[idx]
+    idx += 1
+    flag = 0x80 if num_bytes == 1 else 0x8000
+    while True:
+        if num_bytes == 1:
+            amount = input[idx]
+        else:
+            amount = (input[idx] << 8) | input[idx + 1]
+        idx += num_bytes
+
+        if amount == 0:
+            return idx
+        if (amount & flag) != 0:
+            idx += 1
+        else:
+            idx += amount
+
+
+def rle_comp_size(input: bytes, idx: int) -> int:
+    """Returns the compressed size of RLE data without decompressing it."""
+    end = _skip_rle_pass(input, _skip_rle_pass(input, idx))
+    return end - idx
+
+
+def stream_rle(
+    input: bytes,
+    idx: int,
+    max_size: int = None
+) -> Generator[bytes, None, int]:
+    """
+    Decompresses RLE data, yielding the output in chunks. Stops after
+    max_size bytes if provided. Returns the compressed size if all the data
+    was decompressed.
+    """
+    src_start = idx
+    # The second pass starts after the first, so only skip the first pass
+    # to find it instead of decompressing it
+    second = _skip_rle_pass(input, idx)
+    passes = [_stream_rle_pass(input, idx), _stream_rle_pass(input, second)]
+    bufs = [bytearray(), bytearray()]
+    done = [False, False]
+    end_idx = None
+    dst = 0
+
+    def pull(p: int, size: int) -> None:
+        # Add runs from a pass until the buffer has enough bytes
+        nonlocal end_idx
+        while not done[p] and len(bufs[p]) < size:
+            try:
+                bufs[p] += next(passes[p])
+            except StopIteration as e:
+                done[p] = True
+                if p == 1:
+                    end_idx = e.value
+
+    while True:
+        pull(0, STREAM_CHUNK_SIZE // 2)
+        pull(1, STREAM_CHUNK_SIZE // 2)
+        # Interleave what's available from both passes
+        count = min(len(bufs[0]), len(bufs[1]))
+        if count == 0:
+            break
+        chunk = bytearray(count * 2)
+        chunk[0::2] = bufs[0][:count]
+        chunk[1::2] = bufs[1][:count]
+        del bufs[0][:count]
+        del bufs[1][:count]
+        if max_size is not None and dst + len(chunk) >= max_size:
+            yield bytes(chunk[:max_size - dst])
+            # Check if there's any data left
+            pull(0, 1)
+            pull(1, 1)
+            if len(chunk) > max_size - dst or len(bufs[0]) > 0 or len(bufs[1]) > 0:
+                return None
+            dst = max_size
+            break
+        dst += len(chunk)
+        yield bytes(chunk)
+
+    # Each pass must be equal length
+    if len(bufs[0]) != len(bufs[1]):
+        raise ValueError()
+    return end_idx - src_start
+
+
+def read_stream(stream: Generator[bytes, None, int]) -> tuple[bytes, int]:
+    """Returns all data from a streaming decoder and its compressed size."""
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as e:
+            return b"".join(chunks), e.value
+
+
+def comp_lz77(
+    input: bytes,
+    method: LzCompMethod = LzCompMethod.GREEDY,
+    max_depth: Optional[int] = None
+) -> bytes:
+    """
+    LZ77 compresses data. max_depth is the most earlier positions GREEDY and
+    OPTIMAL check for each match; by default GREEDY checks MAX_CHAIN_DEPTH and
+    OPTIMAL checks every position in the window. MATCHING always checks every
+    position, to reproduce the original compressor's output.
+    """
+    if method == LzCompMethod.MATCHING:
+        return _comp_lz77_greedy(input, True, MAX_WINDOW_SIZE)
+    elif method == LzCompMethod.GREEDY:
+        if max_depth is None:
+            max_depth = MAX_CHAIN_DEPTH
+        return _comp_lz77_greedy(input, False, max_depth)
+    if max_depth is None:
+        max_depth = MAX_WINDOW_SIZE
+    if method == LzCompMethod.OPTIMAL:
+        return _comp_lz77_optimal(input, False, max_depth)
+    elif method == LzCompMethod.OPTIMAL_DP:
+        return _comp_lz77_optimal(input, True, max_depth)
+
+
+def _comp_lz77_greedy(input: bytes, matching: bool, max_depth: int) -> bytes:
     """LZ77 compresses data by greedily selecting the longest match at each step."""
     # Assumes input stream starts at 0
     length = len(input)
     idx = 0
-    longest_matches = _find_longest_matches(input, matching)
+    longest_matches = _find_longest_matches(input, matching, max_depth)
 
     # Write start of data
     output = bytearray()
@@ -215,7 +490,7 @@ def _comp_lz77_greedy(input: bytes, matching: bool) -> bytes:
     raise Exception("LZ77 compression error")
 
 
-def _comp_lz77_optimal(input: bytes) -> bytes:
+def _comp_lz77_optimal(input: bytes, dp: bool, max_depth: int) -> bytes:
     """LZ77 compresses data by finding the optimal sequence of matches."""
     # Assumes input stream starts at 0
     length = len(input)
@@ -223,8 +498,11 @@ def _comp_lz77_optimal(input: bytes) -> bytes:
     flag_counter = 8
     flag_idx = -1
 
-    longest_matches = _find_longest_matches(input, False)
-    path = _find_best_path(length, longest_matches)
+    longest_matches = _find_longest_matches(input, False, max_depth)
+    if dp:
+        path = _find_best_path_dp(length, longest_matches)
+    else:
+        path = _find_best_path(length, longest_matches)
 
     # Write start of data
     output = bytearray()
@@ -261,11 +539,19 @@ def _comp_lz77_optimal(input: bytes) -> bytes:
     return bytes(output)
 
 
-def _find_longest_matches(input: bytes, matching: bool) -> dict[int, tuple[int, int]]:
+def _find_longest_matches(
+    input: bytes,
+    matching: bool,
+    max_depth: int
+) -> dict[int, tuple[int, int]]:
     length = len(input)
-    triplets: dict[int, list[int]] = {}
+    # Most recent position of each triplet, and the previous position with the
+    # same triplet for each position. Following these links visits earlier
+    # positions in order until the window is passed
+    heads: dict[int, int] = {}
+    prev_idxs = [-1] * length
     longest_matches: dict[int, tuple[int, int]] = {}
-    
+
     min_window_size = 4 if matching else 2
     triplet = (input[0] << 8) | (input[1] << 16)
 
@@ -274,9 +560,10 @@ def _find_longest_matches(input: bytes, matching: bool) -> dict[int, tuple[int,
         triplet = (triplet >> 8) | (input[i + 2] << 16)
 
         # Check if triplet has no match
-        indexes = triplets.get(triplet)
-        if indexes is None:
-            triplets[triplet] = [i]
+        idx = heads.get(triplet, -1)
+        prev_idxs[i] = idx
+        heads[triplet] = i
+        if idx == -1:
             continue
 
         window_start = max(i - MAX_WINDOW_SIZE, 0)
@@ -288,26 +575,23 @@ def _find_longest_matches(input: bytes, matching: bool) -> dict[int, tuple[int,
         # the GBA decompression code reads 2 bytes at a time when copying
         # values. To produce matching compression, matches must be at least 4
         # bytes before the current position
-        j = len(indexes) - 1
-        while j >= 0 and indexes[j] > i - min_window_size:
-            j -= 1
+        while idx >= 0 and idx > i - min_window_size:
+            idx = prev_idxs[idx]
 
         # Try each index to find the longest match
-        for j in range(j, -1, -1):
-            idx = indexes[j]
-            # Stop if past window
-            if idx < window_start:
-                break
-
+        depth = max_depth
+        while idx >= window_start and depth > 0:
+            depth -= 1
             # Quick check if match would be longer
             if longest_len > 0 and input[idx + longest_len] != input[i + longest_len]:
+                idx = prev_idxs[idx]
                 continue
 
             # Find length of match
             match_len = MIN_MATCH_SIZE
             while match_len < max_size and input[idx + match_len] == input[i + match_len]:
                 match_len += 1
-            
+
             # Update longest match
             if match_len > longest_len:
                 longest_len = match_len
@@ -316,8 +600,9 @@ def _find_longest_matches(input: bytes, matching: bool) -> dict[int, tuple[int,
                 # Stop looking if max size
                 if longest_len == max_size:
                     break
-            
-        indexes.append(i)
+
+            idx = prev_idxs[idx]
+
         if longest_len >= MIN_MATCH_SIZE:
             longest_matches[i] = (longest_idx, longest_len)
 
@@ -365,6 +650,44 @@ def _find_best_path(length: int, longest_matches: dict[int, tuple[int, int]]) ->
     raise Exception("Processed heap without reaching input length")
 
 
+def _find_best_path_dp(length: int, longest_matches: dict[int, tuple[int, int]]) -> list[int]:
+    """
+    Finds the cheapest path with a single forward pass, since every step
+    moves forward. The cost of each token is its size in bits plus one bit
+    for its flag. The total number of bytes is the ceiling of the total bits
+    divided by 8, so the cheapest path also uses the fewest flag bytes.
+    """
+    # Cost of cheapest path to each position, and previous position on it
+    best_scores = [0] + [-1] * length
+    came_from = [-1] * (length + 1)
+
+    for idx in range(length):
+        score = best_scores[idx]
+        # Uncompressed
+        n = idx + 1
+        prev_score = best_scores[n]
+        if prev_score == -1 or score + 9 < prev_score:
+            best_scores[n] = score + 9
+            came_from[n] = idx
+        # Compressed
+        longest = longest_matches.get(idx)
+        if longest is not None:
+            score += 17
+            for n in range(idx + MIN_MATCH_SIZE, idx + longest[1] + 1):
+                prev_score = best_scores[n]
+                if prev_score == -1 or score < prev_score:
+                    best_scores[n] = score
+                    came_from[n] = idx
+
+    # Construct path from end to start
+    path = [length]
+    idx = length
+    while idx > 0:
+        idx = came_from[idx]
+        path.append(idx)
+    return path
+
+
 def _construct_path(came_from: dict[int, int], idx: int) -> list[int]:
     path: list[int] = [idx]
     while idx in came_from:
@@ -378,12 +701,22 @@ if __name__ == "__main__":
     parser.add_argument("action", type=str, choices=["rle", "lz", "is_lz"])
     apu.add_arg(parser, apu.ArgType.ROM_PATH)
     apu.add_arg(parser, apu.ArgType.ADDR)
+    parser.add_argument("-n", "--num_bytes", type=str,
+        help="Print the first N bytes (hex) of decompressed data")
 
     args = parser.parse_args()
     rom = apu.get_rom(args.rom_path)
     addr = apu.get_hex(args.addr)
 
-    if args.action == "rle":
+    if args.num_bytes is not None and args.action != "is_lz":
+        num_bytes = apu.get_hex(args.num_bytes)
+        if args.action == "rle":
+            stream = stream_rle(rom.data, addr, num_bytes)
+        else:
+            stream = stream_lz77(rom.data, addr, num_bytes)
+        raw, _ = read_stream(stream)
+        print(raw.hex(" ").upper())
+    elif args.action == "rle":
         raw, size = decomp_rle(rom.data, addr)
         print(f"{len(raw):X}\t{size:X}")
     elif args.action == "lz":
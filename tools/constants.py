@@ -3,6 +3,7 @@ YAML_PATH = "../yaml"
 YAML_EXT = ".yml"
 JSON_PATH = "../json"
 JSON_EXT = ".json"
+CACHE_PATH = "../cache"
 
 # Map types
 MAP_CODE = "code"
@@ -0,0 +1,126 @@
+import argparse
+from collections import OrderedDict
+import hashlib
+import weakref
+
+import argparse_utils as apu
+from compress import decomp_lz77, decomp_rle
+from info.info_entry import Compression
+from rom import Rom
+
+
+DEFAULT_BUDGET = 0x400_0000
+"""Default maximum number of decompressed bytes to keep (64 MB)."""
+
+CacheKey = tuple[str, int, Compression]
+
+
+class DecompCache(object):
+    """
+    Least recently used cache of decompressed data, keyed by ROM hash,
+    address, and compression method.
+    """
+
+    def __init__(self, budget: int = DEFAULT_BUDGET):
+        self.budget = budget
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries: OrderedDict[CacheKey, tuple[bytes, int]] = OrderedDict()
+        # ROM version and hash of each ROM
+        self._rom_hashes: weakref.WeakKeyDictionary[Rom, tuple[int, str]] = weakref.WeakKeyDictionary()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({rate:.1%}), "
+            f"{len(self.entries)} entries, {self.size:X}/{self.budget:X} bytes"
+        )
+
+    def rom_hash(self, rom: Rom) -> str:
+        """
+        Returns the hash of the ROM, computing it on first use and after the
+        ROM is written to.
+        """
+        cached = self._rom_hashes.get(rom)
+        if cached is None or cached[0] != rom.version:
+            cached = (rom.version, hashlib.sha1(rom.data).hexdigest())
+            self._rom_hashes[rom] = cached
+        return cached[1]
+
+    def decompress(self, rom: Rom, addr: int, comp: Compression) -> tuple[bytes, int]:
+        """Returns the decompressed data at the address and its compressed size."""
+        key = (self.rom_hash(rom), addr, comp)
+        result = self.entries.get(key)
+        if result is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return result
+        self.misses += 1
+        if comp == Compression.LZ:
+            result = decomp_lz77(rom.data, addr)
+        elif comp == Compression.RLE:
+            result = decomp_rle(rom.data, addr)
+        else:
+            raise ValueError(f"Unknown compression {comp}")
+        size = len(result[0])
+        if size <= self.budget:
+            self.entries[key] = result
+            self.size += size
+            self._evict()
+        return result
+
+    def set_budget(self, budget: int) -> None:
+        self.budget = budget
+        self._evict()
+
+    def clear(self) -> None:
+        """Removes all entries and resets the counters."""
+        self.entries.clear()
+        self._rom_hashes.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self) -> None:
+        # Remove least recently used entries until within budget
+        while self.size > self.budget:
+            _, (data, _) = self.entries.popitem(last=False)
+            self.size -= len(data)
+
+
+_CACHE = DecompCache()
+
+
+def get_decomp_cache() -> DecompCache:
+    """Returns the cache shared by all callers of decompress."""
+    return _CACHE
+
+
+def decompress(rom: Rom, addr: int, comp: Compression) -> tuple[bytes, int]:
+    """
+    Returns the decompressed data at the address and its compressed size,
+    using the shared cache.
+    """
+    return _CACHE.decompress(rom, addr, comp)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("comp", type=str, choices=["rle", "lz"])
+    apu.add_arg(parser, apu.ArgType.ROM_PATH)
+    apu.add_arg(parser, apu.ArgType.ADDR_LIST)
+
+    args = parser.parse_args()
+    rom = apu.get_rom(args.rom_path)
+    addrs = apu.get_hex_list(args.addr_list)
+    comp = Compression.RLE if args.comp == "rle" else Compression.LZ
+
+    for addr in addrs:
+        raw, size = decompress(rom, addr, comp)
+        print(f"{addr:X}\t{len(raw):X}\t{size:X}")
+    print(get_decomp_cache())
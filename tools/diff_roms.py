@@ -1,6 +1,8 @@
 import argparse
 from enum import Flag, auto
 
+import numpy as np
+
 from asm_writer import AsmWriter, AsmFormat
 from rom import Rom, ROM_OFFSET
 from symbols import Symbols
@@ -24,9 +26,13 @@ def diff_roms(rom_base: Rom, rom_new: Rom, options: DiffOpt) -> None:
         writer_base = AsmWriter.create(rom_base, Symbols(), set(), AsmFormat.ARMIPS)
         writer_new = AsmWriter.create(rom_new, Symbols(), set(), AsmFormat.ARMIPS)
     end = 0x800000
-    for addr in range(start, end, 4):
-        val_base = rom_base.read_32(addr)
-        val_new = rom_new.read_32(addr)
+    # Only check words that are different
+    num_words = len(range(start, end, 4))
+    words_base = rom_base.read_u32_array(start, num_words)
+    words_new = rom_new.read_u32_array(start, num_words)
+    is_diff = words_base != words_new
+    addrs = np.arange(start, end, 4)[is_diff]
+    for addr, val_base in zip(addrs.tolist(), words_base[is_diff].tolist()):
         if DiffOpt.SKIP_PTRS in options and ROM_OFFSET <= val_base < ROM_OFFSET + end:
             continue
         if DiffOpt.SKIP_BLS in options and code_start <= addr < code_end:
@@ -40,15 +46,14 @@ def diff_roms(rom_base: Rom, rom_new: Rom, options: DiffOpt) -> None:
                     break
             if is_bl:
                 continue
-        if val_base != val_new:
-            # Print byte difference
-            str_base = " ".join(f"{rom_base.read_8(addr + i):02X}" for i in range(4))
-            str_new = " ".join(f"{rom_new.read_8(addr + i):02X}" for i in range(4))
-            print(f"{addr:X}\t{str_base}\t{str_new}")
-            if code_start <= addr < code_end:
-                # Print instruction difference
-                print_inst_diff(writer_base, writer_new, addr)
-            input()
+        # Print byte difference
+        str_base = " ".join(f"{rom_base.read_8(addr + i):02X}" for i in range(4))
+        str_new = " ".join(f"{rom_new.read_8(addr + i):02X}" for i in range(4))
+        print(f"{addr:X}\t{str_base}\t{str_new}")
+        if code_start <= addr < code_end:
+            # Print instruction difference
+            print_inst_diff(writer_base, writer_new, addr)
+        input()
     print("Done")
 
 
@@ -74,8 +79,8 @@ if __name__ == "__main__":
     parser.add_argument("-d", "--data_only", action="store_true", default=False)
     args = parser.parse_args()
 
-    rom_base = Rom(args.rom_base)
-    rom_new = Rom(args.rom_new)
+    rom_base = Rom(args.rom_base, True)
+    rom_new = Rom(args.rom_new, True)
 
     opt = DiffOpt.NONE
     if args.skip_ptrs:
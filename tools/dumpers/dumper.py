@@ -1,7 +1,7 @@
 import argparse
 
+from analysis_cache import get_analysis
 import argparse_utils as apu
-from function import all_functions
 from info.game_info import GameInfo
 from rom import Rom
 
@@ -32,8 +32,10 @@ def all_funcs(rom: Rom) -> list[tuple[int, int]]:
     """
     Returns (addr, size) pairs for every function in the ROM.
     """
-    funcs = all_functions(rom)
-    sizes = [(f.start_addr, f.end_addr - f.start_addr) for f in funcs]
+    analysis = get_analysis(rom)
+    starts = analysis.func_starts.tolist()
+    ends = analysis.func_ends.tolist()
+    sizes = [(s, e - s) for s, e in zip(starts, ends)]
     sizes += [(k, v - k) for k, v in rom.arm_functions().items()]
     sizes.sort()
     return sizes
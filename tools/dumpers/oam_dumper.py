@@ -1,61 +1,110 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Optional
+
+import numpy as np
 
 import argparse_utils as apu
+from gfx import Gfx, find_palette, get_palette
+from info.asset_type import TypeSpecKind
+from info.game_info import GameInfo
+from info.info_entry import Category, Compression, DataEntry
 from rom import Rom
+from shared_rom import SharedRom, init_worker, worker_rom
+from tilemap import PAL_SHIFT, TILE_MASK, TileAtlas, to_png
 
 
 D16 = ".dh"
 D32 = ".dw"
 INDENT = " " * 4
 
+OBJ_SIZES = [
+    [(8, 8), (16, 16), (32, 32), (64, 64)], # Square
+    [(16, 8), (32, 8), (32, 16), (64, 32)], # Horizontal
+    [(8, 16), (8, 32), (16, 32), (32, 64)], # Vertical
+]
+"""Width and height of a sprite part, indexed by shape and size."""
 
-def dump(rom: Rom, addr: int) -> None:
+SHEET_CHUNK_SIZE = 64
+"""Number of sprite sheets each worker renders at a time."""
+
+OamPart = tuple[int, int, int]
+"""OAM attributes 0-2 of a sprite part."""
+
+OamFrame = tuple[int, int, list[OamPart]]
+"""Address, duration, and parts of a frame."""
+
+Pose = tuple[int, list[OamFrame]]
+"""Address and frames of a frame table."""
+
+AtlasArgs = tuple[int, int, int, int, int]
+"""Graphics address, graphics size (None if compressed), palette address,
+palette rows, and tile offset."""
+
+OamSheet = tuple[str, list[OamFrame], AtlasArgs]
+"""Name, frames, and atlas args (None if unknown) of a sprite sheet."""
+
+
+def read_parts(rom: Rom, addr: int) -> list[OamPart]:
+    num_parts = rom.read_16(addr)
+    attrs = rom.read_u16_array(addr + 2, num_parts * 3).reshape(num_parts, 3)
+    return [tuple(a) for a in attrs.tolist()]
+
+
+def read_frames(rom: Rom, addr: int) -> tuple[list[OamFrame], int]:
+    """
+    Reads the frames of a frame table. Returns the frames and the address
+    after the table's terminator.
+    """
+    frames: list[OamFrame] = []
+    while True:
+        offset = rom.read_32(addr)
+        if offset == 0:
+            return frames, addr + 8
+        offset = rom.read_ptr(addr)
+        duration = rom.read_32(addr + 4)
+        frames.append((offset, duration, read_parts(rom, offset)))
+        addr += 8
+
+
+def read_poses(rom: Rom, addr: int) -> list[Pose]:
+    """Reads consecutive frame tables until one doesn't start with a pointer."""
     data_start = rom.data_start(True)
     data_end = rom.data_end(True)
-    lines1 = [".align 2", ""]
-    lines2 = [".align", ""]
-    oam_num = 0
-    frame_num = 0
-
+    poses: list[Pose] = []
     while True:
-        # For each pose
         offset = rom.read_32(addr)
         if offset < data_start or offset >= data_end:
             break
-  
+        frames, next_addr = read_frames(rom, addr)
+        poses.append((addr, frames))
+        addr = next_addr
+    return poses
+
+
+def dump(rom: Rom, addr: int) -> None:
+    print(dump_poses(read_poses(rom, addr)))
+
+
+def dump_poses(poses: list[Pose]) -> str:
+    lines1 = [".align 2", ""]
+    lines2 = [".align", ""]
+    frame_num = 0
+
+    for oam_num, (addr, frames) in enumerate(poses):
         lines2.append(f"Oam_{oam_num}:")
         lines2.append(f"{INDENT}; {addr:X}")
 
-        while True:
-            # For each frame
-            offset = rom.read_32(addr)
-            if offset == 0:
-                addr += 8
-                break
-                
-            offset = rom.read_ptr(addr)
-            addr += 4
-            duration = rom.read_32(addr)
-            addr += 4
-
+        for _, duration, parts in frames:
             branch_name = f"Oam_{oam_num}_Frame_{frame_num}"
             lines1.append(branch_name + ":")
             lines2.append(f"{INDENT}{D32} {branch_name}")
             lines2.append(f"{INDENT}{D32} {duration}")
 
-            rom.seek(offset)
-            num_parts = rom.read_next_16()
-            lines1.append(f"{INDENT}{D16} {num_parts}")
-
-            for _ in range(num_parts):
-                # For each piece
-                attr1 = rom.read_next_16()
-                attr2 = rom.read_next_16()
-                attr3 = rom.read_next_16()
-
-                a1 = get_attr_str(attr1)
-                a2 = get_attr_str(attr2)
-                a3 = get_attr_str(attr3)
+            lines1.append(f"{INDENT}{D16} {len(parts)}")
+            for part in parts:
+                a1, a2, a3 = (get_attr_str(a) for a in part)
                 lines1.append(f"{INDENT}{D16} {a1},{a2},{a3}")
 
             frame_num += 1
@@ -63,22 +112,336 @@ def dump(rom: Rom, addr: int) -> None:
         lines1.append("")
         lines2.append(f"{INDENT}{D32} 0,0")
         lines2.append("")
-        oam_num += 1
 
-    # Output
-    print("\n".join(lines1) + "\n" + "\n".join(lines2))
+    return "\n".join(lines1) + "\n" + "\n".join(lines2)
 
 
 def get_attr_str(attr: int) -> str:
     return f"0x{attr:04X}"
 
 
+def is_hidden(part: OamPart) -> bool:
+    """Returns whether the part is disabled (not affine, with bit 9 set)."""
+    return part[0] & 0x300 == 0x200
+
+
+def get_part_size(part: OamPart) -> tuple[int, int]:
+    """Returns the width and height of a sprite part's graphics."""
+    attr0, attr1, _ = part
+    return OBJ_SIZES[(attr0 >> 14) % 3][attr1 >> 14]
+
+
+def get_part_rect(part: OamPart) -> tuple[int, int, int, int]:
+    """
+    Returns the x, y, width, and height of a sprite part. Affine parts with
+    the double size bit take up twice the width and height.
+    """
+    attr0, attr1, _ = part
+    width, height = get_part_size(part)
+    if attr0 & 0x300 == 0x300:
+        width *= 2
+        height *= 2
+    y = attr0 & 0xFF
+    if y >= 0x80:
+        y -= 0x100
+    x = attr1 & 0x1FF
+    if x >= 0x100:
+        x -= 0x200
+    return x, y, width, height
+
+
+def get_bounds(frames: list[list[OamPart]]) -> tuple[int, int, int, int]:
+    """Returns the left, top, right, and bottom edges around every part."""
+    rects = [
+        get_part_rect(p) for parts in frames for p in parts if not is_hidden(p)
+    ]
+    if len(rects) == 0:
+        return 0, 0, 1, 1
+    left = min(x for x, _, _, _ in rects)
+    top = min(y for _, y, _, _ in rects)
+    right = max(x + w for x, _, w, _ in rects)
+    bottom = max(y + h for _, y, _, h in rects)
+    return left, top, right, bottom
+
+
+def render_part(atlas: TileAtlas, part: OamPart, one_dim: bool) -> np.ndarray:
+    attr0, attr1, attr2 = part
+    width, height = get_part_size(part)
+    # In 2D mapping, each row of tiles starts 32 tiles after the previous
+    stride = width // 8 if one_dim else 32
+    ty, tx = np.mgrid[0:height // 8, 0:width // 8]
+    tiles = ((attr2 & TILE_MASK) + ty * stride + tx) & TILE_MASK
+    image = atlas.render_tilemap(tiles | (attr2 >> PAL_SHIFT << PAL_SHIFT))
+    # Flip bits are affine parameters for rotated parts
+    if attr0 & 0x100 == 0:
+        if attr1 & 0x1000:
+            image = image[:, ::-1]
+        if attr1 & 0x2000:
+            image = image[::-1]
+    return image
+
+
+def render_frame(
+    atlas: TileAtlas,
+    parts: list[OamPart],
+    bounds: tuple[int, int, int, int],
+    one_dim: bool = False
+) -> np.ndarray:
+    """Returns the image of a frame, using a transparent atlas."""
+    left, top, right, bottom = bounds
+    image = np.zeros((bottom - top, right - left, 4), dtype=np.uint8)
+    # Earlier parts are drawn on top
+    for part in reversed(parts):
+        if is_hidden(part):
+            continue
+        x, y, rect_width, rect_height = get_part_rect(part)
+        width, height = get_part_size(part)
+        # Affine transforms aren't applied, so double size parts are
+        # drawn unrotated in the middle of their area
+        x += (rect_width - width) // 2 - left
+        y += (rect_height - height) // 2 - top
+        part_image = render_part(atlas, part, one_dim)
+        region = image[y:y + height, x:x + width]
+        opaque = part_image[..., 3] != 0
+        region[opaque] = part_image[opaque]
+    return image
+
+
+def render_sheet(
+    atlas: TileAtlas,
+    rows: list[list[OamFrame]],
+    one_dim: bool = False
+) -> np.ndarray:
+    """
+    Returns a sprite sheet with one row per list of frames. Every frame uses
+    the same bounds, so frames stay aligned with each other.
+    """
+    bounds = get_bounds([f[2] for frames in rows for f in frames])
+    left, top, right, bottom = bounds
+    width = right - left
+    height = bottom - top
+    num_rows = max(1, len(rows))
+    num_cols = max(1, max((len(frames) for frames in rows), default=0))
+    sheet = np.zeros((height * num_rows, width * num_cols, 4), dtype=np.uint8)
+    rendered: dict[int, np.ndarray] = {}
+    for r, frames in enumerate(rows):
+        for c, (addr, _, parts) in enumerate(frames):
+            # Frames are often repeated in an animation
+            image = rendered.get(addr)
+            if image is None:
+                image = render_frame(atlas, parts, bounds, one_dim)
+                rendered[addr] = image
+            sheet[r * height:(r + 1) * height, c * width:(c + 1) * width] = image
+    return sheet
+
+
+def get_atlas(rom: Rom, atlas_args: AtlasArgs) -> TileAtlas:
+    gfx_addr, gfx_size, pal_addr, rows, tile_offset = atlas_args
+    gfx = Gfx.from_rom(rom, gfx_addr, gfx_size)
+    palette = get_palette(rom, pal_addr, rows)
+    return TileAtlas(gfx, palette, tile_offset, True)
+
+
+def find_sprite_gfx(oam_name: str, gfx_names: set[str]) -> Optional[str]:
+    """Returns the name of the graphics that most likely go with the frames."""
+    i = oam_name.lower().find("oam")
+    if i == -1:
+        return None
+    base = oam_name[:i]
+    for name in (base, base.removesuffix("Part")):
+        if name + "Gfx" in gfx_names:
+            return name + "Gfx"
+    return None
+
+
+def get_sprite_atlases(info: GameInfo, tile_offset: int) -> dict[str, AtlasArgs]:
+    """Returns the atlas args of every graphics entry with a known palette."""
+    palettes: dict[str, DataEntry] = {}
+    gfx_entries: list[DataEntry] = []
+    for entry in info.data:
+        if entry.is_ptr(info.types):
+            continue
+        if entry.cat == Category.PALETTE:
+            palettes[entry.name] = entry
+        elif entry.cat == Category.GFX:
+            gfx_entries.append(entry)
+    pal_names = sorted(palettes)
+    atlases: dict[str, AtlasArgs] = {}
+    for entry in gfx_entries:
+        pal_name = find_palette(entry.name, pal_names)
+        if pal_name is None:
+            continue
+        if entry.comp is None:
+            size = entry.get_size(info.sizes, info.types)
+            size -= size % 32
+        elif entry.comp == Compression.LZ:
+            size = None
+        else:
+            continue
+        pal = palettes[pal_name]
+        rows = max(1, pal.get_size(info.sizes, info.types) // 32)
+        atlases[entry.name] = (entry.addr, size, pal.addr, rows, tile_offset)
+    return atlases
+
+
+def get_oam_sheets(
+    rom: Rom,
+    info: GameInfo,
+    tile_offset: int = 0
+) -> list[OamSheet]:
+    """
+    Returns the frames of every frame table, followed by every frame entry
+    not in a frame table, each with the graphics and palette named after
+    it (None if there aren't any).
+    """
+    atlases = get_sprite_atlases(info, tile_offset)
+    gfx_names = set(atlases)
+    sheets: list[OamSheet] = []
+    in_tables: set[int] = set()
+    frame_entries = []
+    for entry in info.data:
+        if entry.is_ptr(info.types):
+            continue
+        if entry.cat == Category.OAM_FRAME:
+            frame_entries.append(entry)
+        elif (entry.spec_kind() == TypeSpecKind.STRUCT and
+            entry.spec_name() == "FrameData"):
+            try:
+                frames, _ = read_frames(rom, entry.addr)
+            except (ValueError, IndexError):
+                print(f"Invalid frame table: {entry.name}")
+                continue
+            gfx_name = find_sprite_gfx(entry.name, gfx_names)
+            sheets.append((entry.name, frames, atlases.get(gfx_name)))
+            in_tables.update(f[0] for f in frames)
+    for entry in frame_entries:
+        if entry.addr in in_tables:
+            continue
+        try:
+            parts = read_parts(rom, entry.addr)
+        except (ValueError, IndexError):
+            print(f"Invalid frame: {entry.name}")
+            continue
+        gfx_name = find_sprite_gfx(entry.name, gfx_names)
+        sheets.append((entry.name, [(entry.addr, 0, parts)], atlases.get(gfx_name)))
+    return sheets
+
+
+def _export_sheets(
+    rom: Rom,
+    sheets: list[OamSheet],
+    out_dir: str,
+    one_dim: bool
+) -> int:
+    atlases: dict[AtlasArgs, Optional[TileAtlas]] = {}
+    written = 0
+    for name, frames, atlas_args in sheets:
+        if atlas_args not in atlases:
+            try:
+                atlases[atlas_args] = get_atlas(rom, atlas_args)
+            except (ValueError, IndexError):
+                print(f"Invalid graphics for {name}")
+                atlases[atlas_args] = None
+        atlas = atlases[atlas_args]
+        if atlas is None:
+            continue
+        sheet = render_sheet(atlas, [frames], one_dim)
+        to_png(sheet).save(os.path.join(out_dir, name + ".png"))
+        written += 1
+    return written
+
+
+def _export_sheets_in_worker(
+    sheets: list[OamSheet],
+    out_dir: str,
+    one_dim: bool
+) -> int:
+    # Runs in a worker process
+    return _export_sheets(worker_rom(), sheets, out_dir, one_dim)
+
+
+def export_all(
+    rom: Rom,
+    out_dir: str,
+    tile_offset: int = 0,
+    one_dim: bool = False,
+    jobs: int = 1
+) -> None:
+    """
+    Writes a sprite sheet for every frame table and every frame outside of
+    a frame table whose graphics and palette are known.
+    """
+    info = GameInfo(rom.game, rom.region)
+    sheets = get_oam_sheets(rom, info, tile_offset)
+    unknown = sum(1 for s in sheets if s[2] is None)
+    # Group sheets using the same graphics so each atlas is built once
+    sheets = sorted((s for s in sheets if s[2] is not None), key=lambda s: (s[2][0], s[2][2]))
+    os.makedirs(out_dir, exist_ok=True)
+    if jobs <= 1:
+        written = _export_sheets(rom, sheets, out_dir, one_dim)
+    else:
+        chunks = [
+            sheets[i:i + SHEET_CHUNK_SIZE]
+            for i in range(0, len(sheets), SHEET_CHUNK_SIZE)
+        ]
+        with SharedRom(rom) as shared:
+            with ProcessPoolExecutor(
+                jobs, initializer=init_worker, initargs=shared.init_args()
+            ) as executor:
+                written = sum(executor.map(
+                    _export_sheets_in_worker,
+                    chunks,
+                    [out_dir] * len(chunks),
+                    [one_dim] * len(chunks)
+                ))
+    print(f"Wrote {written} sprite sheets, skipped {unknown} with unknown graphics")
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     apu.add_arg(parser, apu.ArgType.ROM_PATH)
-    apu.add_arg(parser, apu.ArgType.ADDR)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("addr", type=str, nargs="?", help="Hex address")
+    group.add_argument("--all", action="store_true",
+        help="Export a sprite sheet for every frame table with known graphics")
+    parser.add_argument("--out", type=str,
+        help="Output path for a sprite sheet png file (or directory with --all)")
+    apu.add_arg(parser, apu.ArgType.ADDR, "-g", "--gfx")
+    parser.add_argument("-s", "--size", type=str,
+        help="Size of uncompressed graphics (compressed if not provided)")
+    apu.add_arg(parser, apu.ArgType.ADDR, "-p", "--palette")
+    parser.add_argument("-r", "--rows", type=int, default=16,
+        help="Number of palette rows")
+    parser.add_argument("-o", "--tile_offset", type=str, default="0",
+        help="Tile number of the first graphics tile")
+    parser.add_argument("-1", "--one_dim", action="store_true",
+        help="Use 1D tile mapping instead of 2D")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="Number of worker processes (--all only)")
 
     args = parser.parse_args()
     rom = apu.get_rom(args.rom_path)
-    addr = apu.get_hex(args.addr)
-    dump(rom, addr)
+    tile_offset = apu.get_hex(args.tile_offset)
+
+    if args.all:
+        if args.out is None:
+            parser.error("--out is required with --all")
+        export_all(rom, args.out, tile_offset, args.one_dim, args.jobs)
+    else:
+        # Walk the frame tables once for both outputs
+        poses = read_poses(rom, apu.get_hex(args.addr))
+        print(dump_poses(poses))
+        if args.out:
+            if args.gfx is None or args.palette is None:
+                parser.error("--gfx and --palette are required for sprite sheets")
+            size = int(args.size, 16) if args.size else None
+            atlas_args = (
+                apu.get_hex(args.gfx),
+                size,
+                apu.get_hex(args.palette),
+                args.rows,
+                tile_offset
+            )
+            atlas = get_atlas(rom, atlas_args)
+            rows = [frames for _, frames in poses]
+            to_png(render_sheet(atlas, rows, args.one_dim)).save(args.out)
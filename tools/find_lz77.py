@@ -0,0 +1,116 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import argparse_utils as apu
+from compress import is_lz77
+from rom import Rom
+from shared_rom import SharedRom, init_worker, worker_rom
+
+
+MAX_DECOMP_SIZE = 0x40000
+"""Largest plausible decompressed size (the size of EWRAM)."""
+
+SCAN_CHUNK_SIZE = 0x200
+"""Number of candidates each worker validates at a time."""
+
+LzInfo = tuple[int, int, int]
+"""Address, compressed size, and decompressed size of LZ77 data."""
+
+
+def lz77_candidates(rom: Rom, start: int, end: int) -> np.ndarray:
+    """
+    Returns every 4-byte aligned address in [start, end) with the 0x10 flag
+    followed by a plausible decompressed size.
+    """
+    start = (start + 3) & ~3
+    count = len(range(start, end, 4))
+    words = rom.read_u32_array(start, count)
+    sizes = words >> 8
+    is_cand = ((words & 0xFF) == 0x10) & (sizes > 0) & (sizes <= MAX_DECOMP_SIZE)
+    return np.arange(start, end, 4, dtype=np.int64)[is_cand]
+
+
+def _validate(rom: Rom, addrs: list[int]) -> list[LzInfo]:
+    found = []
+    for addr in addrs:
+        try:
+            comp_size = is_lz77(rom.data, addr)
+        except IndexError:
+            # Runs past end of ROM
+            continue
+        if comp_size != -1:
+            decomp_size = rom.read_32(addr) >> 8
+            found.append((addr, comp_size, decomp_size))
+    return found
+
+
+def _validate_chunk(addrs: list[int]) -> list[LzInfo]:
+    # Runs in a worker process
+    return _validate(worker_rom(), addrs)
+
+
+def find_lz77(
+    rom: Rom,
+    start: int = None,
+    end: int = None,
+    jobs: int = 1,
+    overlap: bool = False
+) -> list[LzInfo]:
+    """
+    Finds all valid LZ77 data in [start, end), which defaults to the data
+    region. Unless overlap is True, data starting inside earlier data is
+    skipped.
+    """
+    if start is None:
+        start = rom.data_start()
+    if end is None:
+        end = rom.data_end()
+    addrs = lz77_candidates(rom, start, end).tolist()
+    if jobs <= 1:
+        found = _validate(rom, addrs)
+    else:
+        chunks = [
+            addrs[i:i + SCAN_CHUNK_SIZE]
+            for i in range(0, len(addrs), SCAN_CHUNK_SIZE)
+        ]
+        found = []
+        with SharedRom(rom) as shared:
+            with ProcessPoolExecutor(
+                jobs, initializer=init_worker, initargs=shared.init_args()
+            ) as executor:
+                for chunk_found in executor.map(_validate_chunk, chunks):
+                    found += chunk_found
+    if overlap:
+        return found
+    # Keep the first data of any that overlap
+    result: list[LzInfo] = []
+    prev_end = 0
+    for addr, comp_size, decomp_size in found:
+        if addr >= prev_end:
+            result.append((addr, comp_size, decomp_size))
+            prev_end = addr + comp_size
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    apu.add_arg(parser, apu.ArgType.ROM_PATH)
+    parser.add_argument("-s", "--start", type=str,
+        help="Hex address to start at (default is start of data)")
+    parser.add_argument("-e", "--end", type=str,
+        help="Hex address to end at (default is end of data)")
+    parser.add_argument("-o", "--overlap", action="store_true",
+        help="Include data that starts inside other data")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="Number of worker processes")
+
+    args = parser.parse_args()
+    rom = apu.get_rom(args.rom_path)
+    start = apu.get_hex(args.start) if args.start else None
+    end = apu.get_hex(args.end) if args.end else None
+
+    print("addr\tcomp\tdecomp")
+    for addr, comp_size, decomp_size in find_lz77(rom, start, end, args.jobs, args.overlap):
+        print(f"{addr:X}\t{comp_size:X}\t{decomp_size:X}")
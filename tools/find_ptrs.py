@@ -2,11 +2,12 @@ import argparse
 from enum import Enum
 from typing import Union
 
+from analysis_cache import get_analysis
 import argparse_utils as apu
 from constants import *
-from function import all_functions
 from info.game_info import GameInfo, InfoSource
-from info.info_entry import DataEntry, StructEntry, StructVarEntry, CodeEntry
+from info.info_entry import DataEntry, CodeEntry
+from pointer_index import get_pointer_index
 from rom import Rom, ROM_OFFSET
 
 
@@ -82,17 +83,12 @@ class PtrLoc:
 
 def find_code_ptrs(rom: Rom) -> list[int]:
     """Finds all pointers in code data pools. These are all assumed to be valid."""
-    v_code_start = rom.code_start(True)
-    v_data_end = rom.data_end(True)
-    ptr_locs: list[int] = []
-    funcs = all_functions(rom)
-    for func in funcs:
-        ptr_locs += func.get_jump_tables()
-        for loc in func.data_pool:
-            val = rom.read_32(loc)
-            # Check if value falls within rom
-            if val >= v_code_start and val < v_data_end:
-                ptr_locs.append(loc)
+    analysis = get_analysis(rom)
+    ptr_locs = analysis.jump_addrs.tolist()
+    # Check if value falls within rom
+    pool_locs = analysis.pool_addrs
+    is_ptr = get_pointer_index(rom).has_locs(pool_locs)
+    ptr_locs += pool_locs[is_ptr].tolist()
     ptr_locs.sort()
     return ptr_locs
 
@@ -152,34 +148,32 @@ def find_track_ptrs(rom: Rom):
 
 def find_data_ptrs(rom: Rom, info: GameInfo) -> list[int]:
     code_dict = {c.addr: c for c in info.code}
-    data_list = info.data
+    index = info.get_index(MAP_DATA)
 
     code_end = rom.code_end()
     data_start = rom.data_start()
     data_end = rom.data_end()
-    v_code_start = rom.code_start(True)
-    v_data_end = rom.data_end(True)
 
-    idx = 0
     ptr_locs: list[PtrLoc] = []
 
-    for addr in range(data_start, data_end, 4):
-        # Check if value at address falls within rom
-        val = rom.read_32(addr)
-        if val < v_code_start or val >= v_data_end:
-            continue
+    # Get every value in data that falls within rom
+    addrs, vals = get_pointer_index(rom).locs_in(data_start, data_end)
+
+    for addr, val in zip(addrs.tolist(), vals.tolist()):
         val -= ROM_OFFSET
         # Check if this address falls within a known asset
         validity = Validity.UNKNOWN
         status = Status.UNKNOWN
         main_entry = None
-        idx, entry, _, _ = find_prim_at_offset(data_list, idx, addr, info)
-        if entry:
-            main_entry = data_list[idx]
+        loc = index.resolve(addr)
+        if loc is not None:
+            main_entry, _, fields, _ = loc
+            # Get primitive at the address
+            prim = fields[-1][0] if fields else main_entry
             if main_entry.addr % 4 != 0:
                 validity = Validity.INVALID
                 status = Status.LOC_NOT_ALIGNED
-            elif not entry.is_ptr():
+            elif not prim.is_ptr(info.types):
                 validity = Validity.INVALID
                 status = Status.LOC_NOT_PTR
             else:
@@ -199,9 +193,11 @@ def find_data_ptrs(rom: Rom, info: GameInfo) -> list[int]:
                     status = Status.PTR_CODE
             else:
                 # Check if value points to known data
-                j, entry, prim_idx, prim_off = find_prim_at_offset(data_list, 0, val, info)
-                if entry:
-                    main_entry = data_list[j]
+                loc = index.resolve(val)
+                if loc is not None:
+                    main_entry, prim_idx, fields, prim_off = loc
+                    if fields:
+                        prim_idx = fields[-1][1]
                     if prim_idx != 0 or prim_off != 0:
                         status = Status.PTR_DATA_MIDDLE
                     else:
@@ -211,46 +207,6 @@ def find_data_ptrs(rom: Rom, info: GameInfo) -> list[int]:
     return ptr_locs
 
 
-def find_prim_at_offset(
-    entries: Union[list[DataEntry], list[StructVarEntry]],
-    idx: int,
-    offset: int,
-    info: GameInfo
-) -> tuple[int, Union[DataEntry, StructEntry], int, int]:
-    """
-    Tries to find the primitive at the provided address (for data entries)
-    or offset (for struct var entries).
-    Returns (entry_index, entry, prim_num, prim_offset).
-    """
-    if len(entries) == 0:
-        return (idx, None, None, None)
-    off_attr = "offset" if isinstance(entries[0], StructVarEntry) else "addr"
-    while idx < len(entries) and getattr(entries[idx], off_attr) <= offset:
-        idx += 1
-    idx -= 1
-    entry = entries[idx]
-    # Check if address within entry
-    entry_off = getattr(entry, off_attr)
-    length = entry.get_size(info.sizes)
-    if offset < entry_off + length:
-        # Get offset within single item
-        off = offset - entry_off
-        num = 0
-        count = entry.get_count()
-        if count > 1:
-            size = length // count
-            num = off // size
-            off %= size
-        # Check type
-        is_ptr = entry.is_ptr()
-        if not is_ptr and entry.is_struct():
-            # Check primitive at offset
-            s_entry = info.get_struct(entry.struct_name())
-            _, entry, num, off = find_prim_at_offset(s_entry.vars, 0, off, info)
-        return (idx, entry, num, off)
-    return (idx, None, None, None)
-
-
 def print_ptr_list(title: str, ptrs: list[int]) -> None:
     print(title + ":")
     for loc in ptrs:
@@ -1,5 +1,5 @@
 import argparse
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 from enum import Enum, auto
 
 import argparse_utils as apu
@@ -146,23 +146,28 @@ class Function:
 
     def get_data_pools(self) -> list[tuple[int, int]]:
         # Returns (address, size) pairs of each data pool
-        pools: list[tuple[int, int]] = []
         all_words = self.data_pool | self.get_jump_tables()
-        if len(all_words) == 0:
-            return pools
-        addrs = sorted(all_words)
-
-        prev_addr = addrs[0]
-        pools.append((prev_addr, 4))
-        for addr in addrs[1:]:
-            if addr == prev_addr + 4:
-                start, size = pools[-1]
-                pools[-1] = (start, size + 4)
-            else:
-                pools.append((addr, 4))
-            prev_addr = addr
+        return pool_ranges(all_words)
+
+
+def pool_ranges(words: Iterable[int]) -> list[tuple[int, int]]:
+    """Returns (address, size) pairs of each run of consecutive words."""
+    pools: list[tuple[int, int]] = []
+    addrs = sorted(words)
+    if len(addrs) == 0:
         return pools
 
+    prev_addr = addrs[0]
+    pools.append((prev_addr, 4))
+    for addr in addrs[1:]:
+        if addr == prev_addr + 4:
+            start, size = pools[-1]
+            pools[-1] = (start, size + 4)
+        else:
+            pools.append((addr, 4))
+        prev_addr = addr
+    return pools
+
 
 class FuncDiff(Enum):
 
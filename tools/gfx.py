@@ -1,15 +1,36 @@
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import math
+import os
+from typing import Optional
+import weakref
 
+import numpy as np
 import png
 
 import argparse_utils as apu
-from compress import decomp_lz77
+from compress import is_lz77, rle_comp_size
+from decomp_cache import decompress
+from info.game_info import GameInfo
+from info.info_entry import Category, Compression, DataEntry
 from rom import Rom
+from shared_rom import SharedRom, init_worker, worker_rom
 
 RGB = tuple[int, int, int]
 
 
+def bgr555_to_rgb(colors: np.ndarray) -> np.ndarray:
+    """Converts an array of BGR555 colors to an array of (r, g, b) values."""
+    colors = np.asarray(colors, dtype=np.uint16)
+    rgb = np.empty(colors.shape + (3,), dtype=np.uint8)
+    rgb[..., 0] = (colors & 0x1F) << 3
+    rgb[..., 1] = ((colors >> 5) & 0x1F) << 3
+    rgb[..., 2] = ((colors >> 10) & 0x1F) << 3
+    return rgb
+
+
 class Palette(object):
 
     def __init__(self, rows: int, rom: Rom = None, addr: int = None):
@@ -17,12 +38,8 @@ class Palette(object):
         self.colors = []
         if rom is not None or addr is not None:
             assert rom is not None and addr is not None
-            for i in range(rows * 16):
-                rgb = rom.read_16(addr + i * 2)
-                r = rgb & 0x1F
-                g = (rgb >> 5) & 0x1F
-                b = (rgb >> 10)
-                self.colors.append((r * 8, g * 8, b * 8))
+            rgb = bgr555_to_rgb(rom.read_u16_array(addr, rows * 16))
+            self.colors = [tuple(c) for c in rgb.tolist()]
         else:
             self.colors = [(0, 0, 0) for _ in range(rows * 16)]
 
@@ -34,14 +51,15 @@ class Palette(object):
         size = len(data)
         if size % 32 != 0:
             raise ValueError()
-        pal = Palette(size // 32)
-        for i in range(len(pal.colors)):
-            idx = i * 2
-            rgb = (data[idx+1] << 8) | data[idx]
-            r = rgb & 0x1F
-            g = (rgb >> 5) & 0x1F
-            b = (rgb >> 10)
-            pal.colors[i] = (r * 8, g * 8, b * 8)
+        return cls.from_array(np.frombuffer(data, "<u2"))
+
+    @classmethod
+    def from_array(cls, colors: np.ndarray) -> "Palette":
+        """Creates a palette from an array of BGR555 colors."""
+        if len(colors) % 16 != 0:
+            raise ValueError()
+        pal = Palette(len(colors) // 16)
+        pal.colors = [tuple(c) for c in bgr555_to_rgb(colors).tolist()]
         return pal
 
     @classmethod
@@ -56,6 +74,52 @@ class Palette(object):
         i = row * 16
         return self.colors[i:i+16]
 
+    def to_array(self) -> np.ndarray:
+        """Returns the colors as an array of (r, g, b) values."""
+        return np.array(self.colors, dtype=np.uint8)
+
+
+_PALETTES: weakref.WeakKeyDictionary[
+    Rom, tuple[int, dict[tuple[int, int], Palette]]
+] = weakref.WeakKeyDictionary()
+
+
+def get_palettes(rom: Rom, banks: list[tuple[int, int]]) -> list[Palette]:
+    """
+    Returns the palette at each (address, rows) pair. Palettes are cached per
+    ROM, and any not yet cached are converted together. Returned palettes are
+    shared, so they shouldn't be modified.
+    """
+    # Palettes are converted again after the ROM is written to
+    cached = _PALETTES.get(rom)
+    if cached is None or cached[0] != rom.version:
+        cached = (rom.version, {})
+        _PALETTES[rom] = cached
+    cache = cached[1]
+    missing = [b for b in dict.fromkeys(banks) if b not in cache]
+    if len(missing) > 0:
+        # Gather every color of every missing palette at once
+        rows = np.array([r for _, r in missing], dtype=np.int64)
+        addrs = np.repeat(np.array([a for a, _ in missing], dtype=np.int64), rows * 16)
+        starts = np.repeat(np.cumsum(rows * 16) - rows * 16, rows * 16)
+        addrs += (np.arange(len(addrs)) - starts) * 2
+        data = np.frombuffer(rom.data, dtype=np.uint8)
+        colors = data[addrs].astype(np.uint16) | (data[addrs + 1].astype(np.uint16) << 8)
+        rgb = bgr555_to_rgb(colors).tolist()
+        i = 0
+        for bank in missing:
+            pal = Palette(bank[1])
+            count = bank[1] * 16
+            pal.colors = [tuple(c) for c in rgb[i:i + count]]
+            cache[bank] = pal
+            i += count
+    return [cache[b] for b in banks]
+
+
+def get_palette(rom: Rom, addr: int, rows: int = 1) -> Palette:
+    """Returns the palette at the address, using the per-ROM cache."""
+    return get_palettes(rom, [(addr, rows)])[0]
+
 
 class Gfx(object):
 
@@ -72,7 +136,7 @@ class Gfx(object):
     ):
         if size is None:
             # Compressed
-            data, _ = decomp_lz77(rom.data, addr)
+            data, _ = decompress(rom, addr, Compression.LZ)
         else:
             # Uncompressed
             assert size % 32 == 0
@@ -113,40 +177,226 @@ class Gfx(object):
         else:
             self.data[i] = (self.data[i] & 0xF) | (color << 4)
 
+    def get_pixels(self) -> np.ndarray:
+        """
+        Returns the color index of every pixel as a 2D array. Pixels past the
+        last tile are 0.
+        """
+        tile_width = self.tile_width
+        num_tiles = self.get_num_tiles()
+        tile_rows = math.ceil(num_tiles / tile_width)
+        size = num_tiles * 32
+        data = np.zeros(tile_rows * tile_width * 32, dtype=np.uint8)
+        data[:size] = np.frombuffer(self.data, np.uint8, size)
+        # Low nibble is the left pixel
+        pixels = np.empty(len(data) * 2, dtype=np.uint8)
+        pixels[0::2] = data & 0xF
+        pixels[1::2] = data >> 4
+        # (tile row, tile, y, x) -> (tile row, y, tile, x)
+        pixels = pixels.reshape(tile_rows, tile_width, 8, 8).transpose(0, 2, 1, 3)
+        return pixels.reshape(tile_rows * 8, tile_width * 8)
+
     def draw(self, palette: Palette = None) -> png.Image:
         if palette is None:
             palette = Palette.grayscale()
-        height = math.ceil(self.get_num_tiles() / self.tile_width) * 8
-        width = self.tile_width * 8
-        rows = []
-        for y in range(height):
-            row = []
-            for x in range(width):
-                i = self.get_at(x, y)
-                row += palette[i]
-            rows.append(row)
-        return png.from_array(rows, "RGB")
+        pixels = self.get_pixels()
+        height, width = pixels.shape
+        rgb = palette.to_array()[pixels].reshape(height, width * 3)
+        return png.from_array(rgb, "RGB")
+
+
+HASHES_FILE = "hashes.json"
+"""File in the output directory with the source hash of each exported image."""
+
+GfxExport = tuple[str, int, Optional[Compression], Optional[int], Optional[int]]
+"""Name, address, compression, size of the source bytes (None if unknown),
+and palette address."""
+
+
+def find_palette(gfx_name: str, pal_names: list[str]) -> Optional[str]:
+    """Returns the name of the palette that most likely goes with the graphics."""
+    i = gfx_name.rfind("Gfx")
+    base = gfx_name[:i] if i != -1 else gfx_name
+    for suffix in ("Pal", "Palette"):
+        if base + suffix in pal_names:
+            return base + suffix
+    # Check for palettes with rows or variants after the name
+    for suffix in ("Pal", "Palette"):
+        matches = sorted(n for n in pal_names if n.startswith(base + suffix))
+        if len(matches) > 0:
+            return matches[0]
+    return None
+
+
+def get_gfx_exports(rom: Rom, info: GameInfo) -> list[GfxExport]:
+    """Returns every graphics entry to export, paired with a palette."""
+    palettes: dict[str, DataEntry] = {}
+    gfx_entries: list[DataEntry] = []
+    for entry in info.data:
+        if entry.is_ptr(info.types):
+            continue
+        if entry.cat == Category.PALETTE:
+            palettes[entry.name] = entry
+        elif entry.cat == Category.GFX:
+            gfx_entries.append(entry)
+    pal_names = sorted(palettes)
+    exports: list[GfxExport] = []
+    for entry in gfx_entries:
+        size = entry.get_size(info.sizes, info.types)
+        if entry.comp is None:
+            size -= size % 32
+        elif size == 0:
+            # Compressed size isn't known
+            size = None
+        pal_addr = None
+        pal_name = find_palette(entry.name, pal_names)
+        if pal_name is not None:
+            pal_addr = palettes[pal_name].addr
+        exports.append((entry.name, entry.addr, entry.comp, size, pal_addr))
+    return exports
+
+
+def _comp_size(rom: Rom, addr: int, comp: Compression) -> int:
+    """Returns the size of compressed data without decompressing it."""
+    if comp == Compression.LZ:
+        size = is_lz77(rom.data, addr)
+        if size == -1:
+            raise ValueError(f"Invalid LZ77 data at {addr:X}")
+        return size
+    elif comp == Compression.RLE:
+        return rle_comp_size(rom.data, addr)
+    raise ValueError(f"Unknown compression {comp}")
+
+
+def _export_gfx(
+    rom: Rom,
+    export: GfxExport,
+    out_dir: str,
+    prev_hash: Optional[str]
+) -> tuple[str, Optional[str], bool]:
+    """
+    Writes the image if its source bytes changed. Returns the name, the source
+    hash (None if invalid), and whether the image was written.
+    """
+    name, addr, comp, size, pal_addr = export
+    try:
+        if size is None:
+            size = _comp_size(rom, addr, comp)
+        source = bytes(rom.read_bytes(addr, size))
+    except (ValueError, IndexError):
+        return name, None, False
+    if len(source) < 32:
+        return name, None, False
+    pal_data = b""
+    if pal_addr is not None:
+        pal_data = bytes(rom.read_bytes(pal_addr, 32))
+    # Only decompress if the source bytes changed
+    source_hash = hashlib.sha1(source + pal_data).hexdigest()
+    path = os.path.join(out_dir, name + ".png")
+    if source_hash == prev_hash and os.path.isfile(path):
+        return name, source_hash, False
+    data = source
+    if comp is not None:
+        try:
+            data, _ = decompress(rom, addr, comp)
+        except (ValueError, IndexError):
+            return name, None, False
+        if len(data) < 32:
+            return name, None, False
+    palette = get_palette(rom, pal_addr) if pal_data else None
+    Gfx(data).draw(palette).save(path)
+    return name, source_hash, True
+
+
+def _export_gfx_in_worker(
+    export: GfxExport,
+    out_dir: str,
+    prev_hash: Optional[str]
+) -> tuple[str, Optional[str], bool]:
+    # Runs in a worker process
+    return _export_gfx(worker_rom(), export, out_dir, prev_hash)
+
+
+def export_all(rom: Rom, out_dir: str, jobs: int = 1) -> None:
+    """
+    Writes a png file for every graphics entry, skipping any whose source
+    bytes haven't changed since the last export.
+    """
+    info = GameInfo(rom.game, rom.region)
+    exports = get_gfx_exports(rom, info)
+    os.makedirs(out_dir, exist_ok=True)
+    hashes_path = os.path.join(out_dir, HASHES_FILE)
+    prev: dict[str, str] = {}
+    if os.path.isfile(hashes_path):
+        with open(hashes_path) as f:
+            prev = json.load(f)
+
+    prev_hashes = [prev.get(e[0]) for e in exports]
+    if jobs <= 1:
+        # Convert all palettes at once
+        get_palettes(rom, [(e[4], 1) for e in exports if e[4] is not None])
+        results = [
+            _export_gfx(rom, e, out_dir, h)
+            for e, h in zip(exports, prev_hashes)
+        ]
+    else:
+        with SharedRom(rom) as shared:
+            with ProcessPoolExecutor(
+                jobs, initializer=init_worker, initargs=shared.init_args()
+            ) as executor:
+                results = list(executor.map(
+                    _export_gfx_in_worker,
+                    exports,
+                    [out_dir] * len(exports),
+                    prev_hashes,
+                    chunksize=16
+                ))
+
+    # Only keep hashes of entries that were exported
+    hashes: dict[str, str] = {}
+    written = 0
+    skipped = 0
+    for name, source_hash, was_written in results:
+        if source_hash is None:
+            print(f"Invalid graphics: {name}")
+            continue
+        hashes[name] = source_hash
+        if was_written:
+            written += 1
+        else:
+            skipped += 1
+    with open(hashes_path, "w") as f:
+        json.dump(hashes, f, indent=2, sort_keys=True)
+    print(f"Wrote {written}, skipped {skipped} unchanged")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     apu.add_arg(parser, apu.ArgType.ROM_PATH)
-    apu.add_arg(parser, apu.ArgType.ADDR)
+    parser.add_argument("path", type=str,
+        help="Output path for png file (or directory with --all)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    apu.add_arg(group, apu.ArgType.ADDR, "-a", "--addr")
+    group.add_argument("--all", action="store_true",
+        help="Export every graphics entry")
     parser.add_argument("-s", "--size", type=str)
     apu.add_arg(parser, apu.ArgType.ADDR, "-p", "--palette")
-    parser.add_argument("path", type=str,
-        help="Output path for png file")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="Number of worker processes (--all only)")
 
     args = parser.parse_args()
     rom = apu.get_rom(args.rom_path)
-    gfx_addr = apu.get_hex(args.addr)
-    size = None
-    if args.size:
-        size = int(args.size, 16)
-    pal = None
-    if args.palette:
-        pal_addr = apu.get_hex(args.palette)
-        pal = Palette(1, rom, pal_addr)
-    gfx = Gfx(rom, gfx_addr, size)
-    image = gfx.draw(pal)
-    image.save(args.path)
+    if args.all:
+        export_all(rom, args.path, args.jobs)
+    else:
+        gfx_addr = apu.get_hex(args.addr)
+        size = None
+        if args.size:
+            size = int(args.size, 16)
+        pal = None
+        if args.palette:
+            pal_addr = apu.get_hex(args.palette)
+            pal = get_palette(rom, pal_addr)
+        gfx = Gfx.from_rom(rom, gfx_addr, size)
+        image = gfx.draw(pal)
+        image.save(args.path)
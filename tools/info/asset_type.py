@@ -44,6 +44,15 @@ class TypeQual(Enum):
 
 
 class AssetType(ABC):
+    """
+    Base class for parsed types. Parsed types are shared by every entry with
+    the same type string, so their attributes can't be reassigned.
+    """
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in self.__dict__:
+            raise AttributeError(f"Can't modify shared type attribute {name}")
+        super().__setattr__(name, value)
 
     @abstractmethod
     def spec_kind(self) -> TypeSpecKind:
@@ -114,7 +123,8 @@ class SpecifierType(AssetType):
             ks = self.kind.name.lower()
             raise ValueError(f"Invalid {ks} name {self.spec_name()}")
         elif self.kind == TypeSpecKind.ENUM:
-            raise ValueError("Can't compute size of enum")
+            # Enums are int sized
+            return 4
         else:
             raise RuntimeError()
     
@@ -130,7 +140,7 @@ class SpecifierType(AssetType):
         elif self.kind == TypeSpecKind.STRUCT or self.kind == TypeSpecKind.UNION:
             return 4
         elif self.kind == TypeSpecKind.ENUM:
-            raise ValueError("Can't compute alignment of enum")
+            return 4
         else:
             raise RuntimeError()
 
@@ -366,7 +376,8 @@ class ParseInfo:
         if self.outer is None:
             self.root = new_type
         else:
-            self.outer.inner_type = new_type
+            # Not shared until parsing is done
+            object.__setattr__(self.outer, "inner_type", new_type)
         self.outer = new_type
 
 
@@ -516,6 +527,23 @@ class TypeParser:
             raise ValueError(f"Unexpected type qualifier {qs}")
 
 
+_TOKENIZER = TypeTokenizer()
+_PARSER = TypeParser()
+_PARSED_TYPES: dict[str, AssetType] = {}
+
+
+def parse_type(text: str) -> AssetType:
+    """
+    Returns the parsed type of a type string. Each string is only parsed
+    once, and the same type object is returned to every caller.
+    """
+    asset_type = _PARSED_TYPES.get(text)
+    if asset_type is None:
+        asset_type = _PARSER.parse(_TOKENIZER.tokenize(text))
+        _PARSED_TYPES[text] = asset_type
+    return asset_type
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("text", type=str)
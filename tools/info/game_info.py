@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from functools import cached_property
 
 from constants import *
 from info.asset_type import (
@@ -6,7 +7,9 @@ from info.asset_type import (
     SpecifierType, PointerType, ArrayType, FunctionType
 )
 from info.info_entry import *
-from info.info_file_utils import get_info_file_from_json, get_info_file_from_yaml
+from info.info_file_utils import InfoFile, get_info_file_from_json, get_info_file_from_yaml
+from info.info_snapshot import load_snapshot
+from info.interval_index import IntervalIndex
 
 
 class InfoSource(Enum):
@@ -17,6 +20,10 @@ class InfoSource(Enum):
 
 
 class GameInfo(object):
+    """
+    Info for a game and optionally a region. Each map is loaded and parsed
+    when it's first accessed.
+    """
 
     def __init__(self,
         game: str,
@@ -25,39 +32,63 @@ class GameInfo(object):
     ):
         self.game = game
         self.region = region
+        self.source = source
+        self._indexes: dict[tuple[tuple[str, ...], str], IntervalIndex] = {}
+
+    def _load_map(self, map_type: str) -> InfoFile:
         # Get info from data files
-        if source == InfoSource.JSON:
-            self.ram: list[DataEntry] = get_info_file_from_json(game, MAP_RAM, region)
-            self.code: list[CodeEntry] = get_info_file_from_json(game, MAP_CODE, region)
-            self.data: list[DataEntry] = get_info_file_from_json(game, MAP_DATA, region)
-            struct_list: list[StructEntry] = get_info_file_from_json(game, MAP_STRUCTS, region)
-            enum_list: list[EnumEntry] = get_info_file_from_json(game, MAP_ENUMS, region)
-            union_list: list[UnionEntry] = get_info_file_from_json(game, MAP_UNIONS, region)
-            typedef_list: list[TypedefEntry] = get_info_file_from_json(game, MAP_TYPEDEFS, region)
-        else:
-            include_unk = source == InfoSource.YAML_UNK
-            self.ram: list[DataEntry] = get_info_file_from_yaml(game, MAP_RAM, region, include_unk)
-            self.code: list[CodeEntry] = get_info_file_from_yaml(game, MAP_CODE, region, include_unk)
-            self.data: list[DataEntry] = get_info_file_from_yaml(game, MAP_DATA, region, include_unk)
-            struct_list: list[StructEntry] = get_info_file_from_yaml(game, MAP_STRUCTS, region, include_unk)
-            enum_list: list[EnumEntry] = get_info_file_from_yaml(game, MAP_ENUMS, region, include_unk)
-            union_list: list[UnionEntry] = get_info_file_from_yaml(game, MAP_UNIONS, region, include_unk)
-            typedef_list: list[TypedefEntry] = get_info_file_from_yaml(game, MAP_TYPEDEFS, region, include_unk)
-        # Convert lists to dictionaries
-        self.structs: dict[str, StructEntry] = {e.name: e for e in struct_list}
-        self.enums: dict[str, EnumEntry] = {e.name: e for e in enum_list}
-        self.unions: dict[str, UnionEntry] = {e.name: e for e in union_list}
-        self.typedefs: dict[str, TypedefEntry] = {e.name: e for e in typedef_list}
-        self.types: dict[str, AssetType] = {e.name: e.type for e in typedef_list}
-        # Get sizes of structs, unions, and typedefs
-        self.sizes: dict[str, int] = {}
-        for e in struct_list:
-            self.sizes[e.name] = e.size
-        for e in union_list:
-            self.sizes[e.name] = e.size
-        # for e in typedef_list:
-        #     if e.name not in self.sizes:
-        #         self.sizes[e.name] = self._type_size(e.type)
+        if self.source == InfoSource.JSON:
+            ifile = load_snapshot(self.game, map_type, self.region)
+            if ifile is None:
+                ifile = get_info_file_from_json(self.game, map_type, self.region)
+            return ifile
+        include_unk = self.source == InfoSource.YAML_UNK
+        return get_info_file_from_yaml(self.game, map_type, self.region, include_unk)
+
+    @cached_property
+    def ram(self) -> list[DataEntry]:
+        return self._load_map(MAP_RAM)
+
+    @cached_property
+    def code(self) -> list[CodeEntry]:
+        return self._load_map(MAP_CODE)
+
+    @cached_property
+    def data(self) -> list[DataEntry]:
+        return self._load_map(MAP_DATA)
+
+    @cached_property
+    def structs(self) -> dict[str, StructEntry]:
+        return {e.name: e for e in self._load_map(MAP_STRUCTS)}
+
+    @cached_property
+    def enums(self) -> dict[str, EnumEntry]:
+        return {e.name: e for e in self._load_map(MAP_ENUMS)}
+
+    @cached_property
+    def unions(self) -> dict[str, UnionEntry]:
+        return {e.name: e for e in self._load_map(MAP_UNIONS)}
+
+    @cached_property
+    def typedefs(self) -> dict[str, TypedefEntry]:
+        return {e.name: e for e in self._load_map(MAP_TYPEDEFS)}
+
+    @cached_property
+    def types(self) -> dict[str, AssetType]:
+        return {n: e.type for n, e in self.typedefs.items()}
+
+    @cached_property
+    def sizes(self) -> dict[str, int]:
+        """Sizes of structs and unions."""
+        sizes: dict[str, int] = {}
+        for e in self.structs.values():
+            sizes[e.name] = e.size
+        for e in self.unions.values():
+            sizes[e.name] = e.size
+        # for e in self.typedefs.values():
+        #     if e.name not in sizes:
+        #         sizes[e.name] = self._type_size(e.type)
+        return sizes
 
     def get_enum(self, key: str) -> EnumEntry:
         return self.enums[key]
@@ -65,23 +96,37 @@ class GameInfo(object):
     def get_struct(self, key: str) -> StructEntry:
         return self.structs[key]
 
+    @cached_property
+    def _ram_by_name(self) -> dict[str, DataEntry]:
+        # Reversed so the first entry with a name is kept
+        return {e.name: e for e in reversed(self.ram)}
+
+    @cached_property
+    def _code_by_name(self) -> dict[str, CodeEntry]:
+        return {e.name: e for e in reversed(self.code)}
+
+    @cached_property
+    def _data_by_name(self) -> dict[str, DataEntry]:
+        return {e.name: e for e in reversed(self.data)}
+
+    @cached_property
+    def _by_addr(self) -> dict[int, InfoEntry]:
+        # Entries without a single address (no region) can't be looked up
+        by_addr: dict[int, InfoEntry] = {}
+        for entry_list in (self.ram, self.code, self.data):
+            for entry in entry_list:
+                if isinstance(entry.addr, int):
+                    by_addr.setdefault(entry.addr, entry)
+        return by_addr
+
     def get_ram(self, name: str) -> DataEntry:
-        for gv in self.ram:
-            if gv.name == name:
-                return gv
-        return None
+        return self._ram_by_name.get(name)
 
     def get_code(self, name: str) -> CodeEntry:
-        for ce in self.code:
-            if ce.name == name:
-                return ce
-        return None
+        return self._code_by_name.get(name)
 
     def get_data(self, name: str) -> DataEntry:
-        for gv in self.data:
-            if gv.name == name:
-                return gv
-        return None
+        return self._data_by_name.get(name)
 
     def get_entry(self, name: str) -> InfoEntry:
         getters = (self.get_ram, self.get_code, self.get_data)
@@ -92,12 +137,26 @@ class GameInfo(object):
         return None
 
     def get_entry_by_addr(self, addr: int) -> InfoEntry:
-        entry_lists = (self.ram, self.code, self.data)
-        for entry_list in entry_lists:
-            for entry in entry_list:
-                if entry.addr == addr:
-                    return entry
-        return None
+        return self._by_addr.get(addr)
+
+    def get_index(self, *map_types: str, region: str = None) -> IntervalIndex:
+        """
+        Returns an interval index of the entries in the code, data, and/or
+        ram maps for the region (or this info's region). Indexes are built
+        on first use and shared by all callers.
+        """
+        if region is None:
+            region = self.region
+        key = (map_types, region)
+        index = self._indexes.get(key)
+        if index is None:
+            entries = []
+            for map_type in map_types:
+                assert map_type in (MAP_CODE, MAP_DATA, MAP_RAM)
+                entries += getattr(self, map_type)
+            index = IntervalIndex(entries, region, self.sizes, self.types, self.structs)
+            self._indexes[key] = index
+        return index
 
     def name_exists(self, name: str) -> bool:
         return self.get_entry(name) is not None
@@ -5,16 +5,13 @@ from typing import Any, Union
 from constants import *
 from info.asset_type import (
     BUILT_IN_SIZES, TypeSpecKind, AssetType, SpecifierType, OuterType,
-    PointerType, ArrayType, FunctionType, TypeTokenizer, TypeParser
+    PointerType, ArrayType, FunctionType, parse_type
 )
 
 
 RegionInt = Union[int, dict[str, int]]
 """Type for numbers that can vary by region (addr, size)"""
 
-TOKENIZER = TypeTokenizer()
-PARSER = TypeParser()
-
 
 class Category(Enum):
 
@@ -132,8 +129,7 @@ class TypedefEntry(InfoEntry):
     ):
         super().__init__(desc)
         self.name = name
-        tokens = TOKENIZER.tokenize(type)
-        self.type = PARSER.parse(tokens)
+        self.type = parse_type(type)
         self.loc = loc
 
     def __str__(self) -> str:
@@ -174,8 +170,7 @@ class VarEntry(InfoEntry):
         enum: str = None
     ):
         super().__init__(desc)
-        tokens = TOKENIZER.tokenize(type)
-        self.type = PARSER.parse(tokens)
+        self.type = parse_type(type)
         self.arr_count = arr_count
         self.cat = cat
         self.comp = comp
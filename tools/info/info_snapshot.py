@@ -0,0 +1,69 @@
+import hashlib
+import os
+import pickle
+from typing import Optional
+
+from constants import *
+from info.info_entry import *
+from info.info_file_utils import InfoFile, find_json_file, get_info_file_from_json
+
+
+SNAPSHOT_SOURCES = (
+    "constants.py",
+    "info/asset_type.py",
+    "info/info_entry.py",
+    "info/info_file_utils.py",
+    "info/info_snapshot.py"
+)
+"""Source files whose contents affect the pickled entries."""
+
+
+def snapshot_path(game: str, map_type: str, region: str = None) -> str:
+    region = "all" if region is None else region
+    return os.path.join(CACHE_PATH, f"{game}_{region}_{map_type}.pickle")
+
+
+def snapshot_version(game: str, map_type: str) -> str:
+    """Returns a hash of the map's json file and the entry source files."""
+    sha = hashlib.sha1()
+    tools_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for name in SNAPSHOT_SOURCES:
+        with open(os.path.join(tools_dir, name), "rb") as f:
+            sha.update(f.read())
+    with open(find_json_file(game, map_type), "rb") as f:
+        sha.update(f.read())
+    return sha.hexdigest()
+
+
+def write_snapshot(game: str) -> None:
+    """
+    Parses the game's json files and pickles the entries of each map for
+    each region (and for all regions), so they can be loaded without parsing.
+    """
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    for map_type in MAP_TYPES:
+        version = snapshot_version(game, map_type)
+        for region in (None,) + game_regions(game):
+            ifile = get_info_file_from_json(game, map_type, region)
+            with open(snapshot_path(game, map_type, region), "wb") as f:
+                pickle.dump((version, ifile), f, pickle.HIGHEST_PROTOCOL)
+
+
+def load_snapshot(game: str, map_type: str, region: str = None) -> Optional[InfoFile]:
+    """
+    Returns the entries of the map from the game's snapshot, or None if it's
+    missing or the json file or entry classes have changed since it was
+    written.
+    """
+    path = snapshot_path(game, map_type, region)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            version, ifile = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+        # Corrupted or outdated file
+        return None
+    if version != snapshot_version(game, map_type):
+        return None
+    return ifile
@@ -0,0 +1,218 @@
+import bisect
+from typing import Any, Optional
+
+from constants import *
+from info.asset_type import AssetType, SpecifierType, TypeSpecKind
+from info.info_entry import CodeEntry, InfoEntry, RegionInt, StructEntry, StructVarEntry, VarEntry
+
+
+FieldPath = list[tuple[StructVarEntry, int]]
+"""Struct fields from outermost to innermost, each with its array index."""
+
+Location = tuple[InfoEntry, int, FieldPath, int]
+"""Entry, array index within the entry, struct fields, and offset within
+the innermost element."""
+
+
+def region_int(value: RegionInt, region: str) -> Optional[int]:
+    """
+    Returns the value for the region. If region is None, the value of the
+    first region with one is used.
+    """
+    if not isinstance(value, dict):
+        return value
+    if region is not None:
+        return value.get(region)
+    for r in ALL_REGIONS:
+        if r in value:
+            return value[r]
+    return None
+
+
+class Intervals(object):
+    """
+    Sorted [start, end) intervals, each made of equal size elements and
+    paired with an item. Intervals may overlap or be empty.
+    """
+
+    def __init__(self, spans: list[tuple[int, int, int, Any]]):
+        # Stable sort keeps the original order of equal starts
+        spans = sorted(spans, key=lambda s: s[0])
+        self.starts = [s[0] for s in spans]
+        self.ends = [s[1] for s in spans]
+        self.strides = [s[2] for s in spans]
+        self.items = [s[3] for s in spans]
+        # Highest end of each interval and all before it
+        self.max_ends: list[int] = []
+        max_end = -1
+        for end in self.ends:
+            max_end = max(max_end, end)
+            self.max_ends.append(max_end)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def find_prev(self, addr: int) -> int:
+        """Returns the index of the last interval starting at or before addr, or -1."""
+        return bisect.bisect_right(self.starts, addr) - 1
+
+    def find(self, addr: int) -> int:
+        """
+        Returns the index of the last interval starting at or before addr
+        that contains addr, or -1.
+        """
+        i = self.find_prev(addr)
+        while i >= 0 and self.max_ends[i] > addr:
+            if self.ends[i] > addr:
+                return i
+            i -= 1
+        return -1
+
+
+class IntervalIndex(object):
+    """
+    Address intervals of code, data, or ram entries in one region. Addresses
+    can be resolved into the struct fields of data entries. Entries and
+    struct fields whose size can't be computed (such as an unknown struct
+    name) aren't indexed and are listed in errors instead.
+    """
+
+    def __init__(self,
+        entries: list[InfoEntry],
+        region: str,
+        sizes: dict[str, int],
+        types: dict[str, AssetType],
+        structs: dict[str, StructEntry]
+    ):
+        self.region = region
+        self.sizes = sizes
+        self.types = types
+        self.structs = structs
+        self.errors: list[tuple[InfoEntry, str]] = []
+        self._error_ids: dict[int, str] = {}
+        spans = []
+        for entry in entries:
+            # Entries without an address in the region are skipped
+            if isinstance(entry.addr, dict):
+                if region is None or region not in entry.addr:
+                    continue
+                start = entry.addr[region]
+            else:
+                start = entry.addr
+            stride = self._get_stride_or_error(entry)
+            if stride is None:
+                continue
+            size, count = stride
+            spans.append((start, start + size * count, size, entry))
+        self.intervals = Intervals(spans)
+        self._spans = {
+            id(e): (s, end)
+            for s, end, e in zip(self.intervals.starts, self.intervals.ends, self.intervals.items)
+        }
+        self._struct_fields: dict[str, Intervals] = {}
+
+    def get_stride(self, entry: InfoEntry) -> tuple[int, int]:
+        """
+        Returns the element size and count of a code, data, ram, or struct
+        var entry. Raises an error if the entry's type is invalid.
+        """
+        if isinstance(entry, CodeEntry):
+            return self._region_count(entry.size), 1
+        size = entry.type.get_size(self.sizes, self.types)
+        count = 1
+        if entry.arr_count is not None:
+            count = self._region_count(entry.arr_count)
+        return size, count
+
+    def _get_stride_or_error(self, entry: InfoEntry) -> Optional[tuple[int, int]]:
+        try:
+            return self.get_stride(entry)
+        except ValueError as e:
+            error = str(e)
+        except KeyError as e:
+            error = f"Invalid typedef name {e.args[0]}"
+        self.errors.append((entry, error))
+        self._error_ids[id(entry)] = error
+        return None
+
+    def get_error(self, entry: InfoEntry) -> Optional[str]:
+        """Returns why the entry isn't indexed if its size is unknown, or None."""
+        return self._error_ids.get(id(entry))
+
+    def _region_count(self, value: RegionInt) -> int:
+        # Use the first region if the value doesn't vary by this region
+        count = region_int(value, self.region)
+        if count is None:
+            count = region_int(value, None)
+        return count or 0
+
+    def span(self, entry: InfoEntry) -> Optional[tuple[int, int]]:
+        """Returns the [start, end) of the entry, or None if not indexed."""
+        return self._spans.get(id(entry))
+
+    def get_prev(self, addr: int) -> InfoEntry:
+        """Returns the last entry starting at or before addr."""
+        i = self.intervals.find_prev(addr)
+        return self.intervals.items[i] if i >= 0 else None
+
+    def find(self, addr: int) -> Optional[tuple[InfoEntry, int, int]]:
+        """
+        Returns the entry containing addr, the array index within the entry,
+        and the offset within the element, or None.
+        """
+        intervals = self.intervals
+        i = intervals.find(addr)
+        if i == -1:
+            return None
+        idx, off = divmod(addr - intervals.starts[i], intervals.strides[i])
+        return intervals.items[i], idx, off
+
+    def resolve(self, addr: int) -> Optional[Location]:
+        """
+        Returns the entry containing addr and the struct fields containing
+        addr within it, or None.
+        """
+        found = self.find(addr)
+        if found is None:
+            return None
+        entry, idx, off = found
+        path: FieldPath = []
+        if isinstance(entry, VarEntry):
+            name = self.get_struct_name(entry.type)
+            while name is not None:
+                fields = self.get_struct_fields(name)
+                i = fields.find(off)
+                if i == -1:
+                    break
+                field = fields.items[i]
+                field_idx, off = divmod(off - fields.starts[i], fields.strides[i])
+                path.append((field, field_idx))
+                name = self.get_struct_name(field.type)
+        return entry, idx, path, off
+
+    def get_struct_name(self, type: AssetType) -> Optional[str]:
+        """Returns the struct name of a (non-pointer) struct type, or None."""
+        while isinstance(type, SpecifierType) and type.kind == TypeSpecKind.TYPEDEF:
+            type = self.types.get(type.spec_name())
+        if isinstance(type, SpecifierType) and type.kind == TypeSpecKind.STRUCT:
+            name = type.spec_name()
+            if name in self.structs:
+                return name
+        return None
+
+    def get_struct_fields(self, name: str) -> Intervals:
+        fields = self._struct_fields.get(name)
+        if fields is None:
+            spans = []
+            for var in self.structs[name].vars:
+                offset = region_int(var.offset, self.region)
+                if offset is None:
+                    continue
+                stride = self._get_stride_or_error(var)
+                if stride is None:
+                    continue
+                size, count = stride
+                spans.append((offset, offset + size * count, size, var))
+            fields = Intervals(spans)
+            self._struct_fields[name] = fields
+        return fields
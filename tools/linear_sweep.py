@@ -0,0 +1,275 @@
+import argparse
+import time
+
+import numpy as np
+
+import argparse_utils as apu
+from rom import Rom
+from thumb import ThumbForm
+
+
+# Halfword kinds used when sweeping
+KIND_OTHER = 0
+KIND_END = 1
+"""bx Rs, mov r15,r14, or pop {...,r15}"""
+KIND_JUMP = 2
+"""mov r15,Rs (followed by a jump table)"""
+KIND_LDR_PC = 3
+"""ldr Rd,=Word (aux is the pool address)"""
+KIND_BRANCH = 4
+"""Conditional or unconditional branch (aux is the target)"""
+KIND_LINK = 5
+"""First half of bl (aux is the target)"""
+
+SWEEP_MARGIN = 0x1000
+"""Number of bytes past the end of code to classify up front."""
+
+
+def _sign_extend(vals: np.ndarray, bits: int) -> np.ndarray:
+    flag = 1 << (bits - 1)
+    return vals - ((vals & flag) << 1)
+
+
+def format_table() -> np.ndarray:
+    """Returns the ThumbForm value of every halfword."""
+    h = np.arange(0x10000, dtype=np.int64)
+    b13 = h >> 13
+    bit = lambda n: (h >> n) & 1 == 1
+    b8_11 = (h >> 8) & 15
+    conds = [
+        (b13 == 0) & ((h >> 11) & 3 == 3),
+        b13 == 0,
+        b13 == 1,
+        (b13 == 2) & bit(12) & bit(9),
+        (b13 == 2) & bit(12),
+        (b13 == 2) & bit(11),
+        (b13 == 2) & bit(10),
+        b13 == 2,
+        b13 == 3,
+        (b13 == 4) & bit(12),
+        b13 == 4,
+        (b13 == 5) & bit(12) & (b8_11 == 0),
+        (b13 == 5) & bit(12) & (b8_11 == 14),
+        (b13 == 5) & bit(12),
+        b13 == 5,
+        (b13 == 6) & bit(12) & (b8_11 == 14),
+        (b13 == 6) & bit(12) & (b8_11 == 15),
+        (b13 == 6) & bit(12),
+        b13 == 6,
+        bit(12),
+    ]
+    forms = [
+        ThumbForm.AddSub, ThumbForm.Shift, ThumbForm.Immed,
+        ThumbForm.LdStRS, ThumbForm.LdStR, ThumbForm.LdPC,
+        ThumbForm.HiReg, ThumbForm.AluOp, ThumbForm.LdStI,
+        ThumbForm.LdStSP, ThumbForm.LdStIH, ThumbForm.AddSP,
+        ThumbForm.Undef, ThumbForm.PushPop, ThumbForm.RelAddr,
+        ThumbForm.Undef, ThumbForm.Swi, ThumbForm.CondB,
+        ThumbForm.LdStM, ThumbForm.Link
+    ]
+    choices = [f.value for f in forms]
+    return np.select(conds, choices, ThumbForm.UncondB.value).astype(np.uint8)
+
+
+FORM_TABLE = format_table()
+
+
+class Classified(object):
+    """Kind, target, and format of every halfword in [start, end)."""
+
+    def __init__(self, rom: Rom, start: int, end: int):
+        self.start = start
+        self.end = end
+        count = (end - start) // 2
+        # Include the halfword after the end for the second half of bl
+        count_next = min(count + 1, (len(rom.data) - start) // 2)
+        h = np.zeros(count + 1, dtype=np.int64)
+        h[:count_next] = rom.read_u16_array(start, count_next)
+        h2 = h[1:]
+        h = h[:-1]
+        addrs = np.arange(start, end, 2, dtype=np.int64)
+        forms = FORM_TABLE[h]
+        kinds = np.zeros(count, dtype=np.int8)
+        auxs = np.zeros(count, dtype=np.int64)
+
+        # mov r15,Rs or bx Rs
+        is_hi = forms == ThumbForm.HiReg.value
+        op = (h >> 8) & 3
+        rd = ((h & 0x80) >> 4) | (h & 7)
+        rs = (h >> 3) & 15
+        is_mov_pc = is_hi & (op == 2) & (rd == 15)
+        kinds[is_mov_pc] = KIND_JUMP
+        kinds[is_mov_pc & (rs == 14)] = KIND_END
+        kinds[is_hi & (op == 3)] = KIND_END
+        # pop {...,r15}
+        is_pop_pc = (forms == ThumbForm.PushPop.value) & ((h & 0x900) == 0x900)
+        kinds[is_pop_pc] = KIND_END
+        # ldr Rd,=Word
+        is_ldr = forms == ThumbForm.LdPC.value
+        kinds[is_ldr] = KIND_LDR_PC
+        auxs[is_ldr] = ((addrs[is_ldr] + 4) & ~2) + (h[is_ldr] & 0xFF) * 4
+        # b label and bcc label
+        is_cond = forms == ThumbForm.CondB.value
+        is_uncond = forms == ThumbForm.UncondB.value
+        kinds[is_cond | is_uncond] = KIND_BRANCH
+        auxs[is_cond] = addrs[is_cond] + 4 + _sign_extend(h[is_cond] & 0xFF, 8) * 2
+        auxs[is_uncond] = addrs[is_uncond] + 4 + _sign_extend(h[is_uncond] & 0x7FF, 11) * 2
+        # bl label
+        is_bl = forms == ThumbForm.Link.value
+        off = ((h[is_bl] & 0x7FF) << 11) | (h2[is_bl] & 0x7FF)
+        kinds[is_bl] = KIND_LINK
+        auxs[is_bl] = addrs[is_bl] + 4 + _sign_extend(off, 22) * 2
+
+        # Lists are faster to index from python
+        self.halves: list[int] = h.tolist()
+        self.kinds: list[int] = kinds.tolist()
+        self.auxs: list[int] = auxs.tolist()
+        self.forms: list[int] = forms.tolist()
+
+
+class LinearSweep(object):
+    """
+    Finds every THUMB function in the ROM by classifying all halfwords of
+    code at once, then stepping through each function the same way
+    Function does.
+    """
+
+    def __init__(self, rom: Rom):
+        self.rom = rom
+        end = min(rom.code_end() + SWEEP_MARGIN, len(rom.data))
+        self.cls = Classified(rom, rom.code_start(), end)
+        self.lists: dict[str, list[int]] = {
+            "func_starts": [], "func_ends": [],
+            "inst_idxs": [], "inst_addrs": [], "inst_forms": [],
+            "pool_idxs": [], "pool_addrs": [],
+            "jump_idxs": [], "jump_addrs": [],
+            "bl_idxs": [], "bl_addrs": [], "bl_targets": []
+        }
+
+    def _extend(self, addr: int) -> None:
+        # Classify more halfwords if a function runs past what's classified
+        end = min(max(addr + 2, self.cls.end * 2 - self.cls.start), len(self.rom.data))
+        if addr >= end:
+            raise IndexError(f"Function runs past end of ROM at {addr:X}")
+        self.cls = Classified(self.rom, self.cls.start, end)
+
+    def sweep(self) -> dict[str, np.ndarray]:
+        """Returns the arrays of a RomAnalysis for every THUMB function."""
+        rom = self.rom
+        addr = rom.code_start()
+        code_end = rom.code_end()
+        arm_funcs = rom.arm_functions()
+        while addr < code_end:
+            if addr in arm_funcs:
+                addr = arm_funcs[addr]
+            else:
+                addr = self.sweep_function(addr)
+        lists = self.lists
+        for field in ("inst_idxs", "pool_idxs", "jump_idxs", "bl_idxs"):
+            addrs_field = field.replace("_idxs", "_addrs")
+            lists[field].append(len(lists[addrs_field]))
+        arrays = {f: np.array(v, dtype=np.int64) for f, v in lists.items()}
+        arrays["inst_forms"] = arrays["inst_forms"].astype(np.uint8)
+        return arrays
+
+    def sweep_function(self, start: int) -> int:
+        """Steps through the function and returns its end address."""
+        cls = self.cls
+        base = cls.start
+        pool: set[int] = set()
+        branches: set[int] = set()
+        jump_starts: list[int] = []
+        inst_addrs: list[int] = []
+        inst_forms: list[int] = []
+        bls: list[tuple[int, int]] = []
+
+        addr = start
+        at_end = False
+        while not at_end:
+            if addr >= cls.end:
+                self._extend(addr)
+                cls = self.cls
+            i = (addr - base) >> 1
+            # Skip if in data pool
+            if addr in pool or (
+                addr & 2 and
+                cls.halves[i] == 0 and
+                addr + 2 in pool
+            ):
+                addr = ((addr + 3) & ~3) + 4
+                continue
+
+            kind = cls.kinds[i]
+            inst_addrs.append(addr)
+            inst_forms.append(cls.forms[i])
+            if kind == KIND_LINK:
+                bls.append((addr, cls.auxs[i]))
+                addr += 4
+                continue
+            addr += 2
+            if kind == KIND_END:
+                at_end = True
+            elif kind == KIND_LDR_PC:
+                pool.add(cls.auxs[i])
+            elif kind == KIND_BRANCH:
+                branches.add(cls.auxs[i])
+            elif kind == KIND_JUMP:
+                # Find start of table (should start after data pool)
+                addr = (addr + 3) & ~3
+                while addr in pool:
+                    addr += 4
+                jump_starts.append(addr)
+                # Find all branches in table
+                while addr not in branches:
+                    branches.add(self.rom.read_ptr(addr))
+                    addr += 4
+
+        # Find end of last data pool (if present)
+        addr = (addr + 3) & ~3
+        while addr in pool:
+            addr += 4
+        end = addr
+
+        # Find any bls that are local branches
+        for _, target in bls:
+            if target > start and target < end:
+                branches.add(target)
+
+        # Get all words in jump tables
+        jumps: set[int] = set()
+        for offset in jump_starts:
+            while offset not in branches:
+                jumps.add(offset)
+                offset += 4
+
+        lists = self.lists
+        lists["func_starts"].append(start)
+        lists["func_ends"].append(end)
+        lists["inst_idxs"].append(len(lists["inst_addrs"]))
+        lists["inst_addrs"] += inst_addrs
+        lists["inst_forms"] += inst_forms
+        lists["pool_idxs"].append(len(lists["pool_addrs"]))
+        lists["pool_addrs"] += sorted(pool)
+        lists["jump_idxs"].append(len(lists["jump_addrs"]))
+        lists["jump_addrs"] += sorted(jumps)
+        lists["bl_idxs"].append(len(lists["bl_addrs"]))
+        lists["bl_addrs"] += [a for a, _ in bls]
+        lists["bl_targets"] += [t for _, t in bls]
+        return end
+
+
+def sweep_functions(rom: Rom) -> dict[str, np.ndarray]:
+    """Returns the arrays of a RomAnalysis for every THUMB function in the ROM."""
+    return LinearSweep(rom).sweep()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    apu.add_arg(parser, apu.ArgType.ROM_PATH)
+
+    args = parser.parse_args()
+    rom = apu.get_rom(args.rom_path)
+    start = time.perf_counter()
+    arrays = sweep_functions(rom)
+    elapsed = time.perf_counter() - start
+    print(f"Found {len(arrays['func_starts'])} functions in {elapsed:.2f}s")
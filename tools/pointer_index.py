@@ -0,0 +1,102 @@
+import argparse
+from typing import Optional
+import weakref
+
+import numpy as np
+
+import argparse_utils as apu
+from rom import Rom, ROM_OFFSET
+
+
+class PointerIndex(object):
+    """
+    Index of every 4-byte aligned word from the start of code to the end of
+    data whose value falls within the ROM. Values are stored as read (with
+    the ROM offset and any THUMB bit included).
+    """
+
+    def __init__(self, rom: Rom):
+        self.version = rom.version
+        start = rom.code_start()
+        end = rom.data_end()
+        num_words = len(range(start, end, 4))
+        words = rom.read_u32_array(start, num_words)
+        is_ptr = (words >= rom.code_start(True)) & (words < rom.data_end(True))
+        # Sorted by location
+        self.locs = np.arange(start, end, 4, dtype=np.int64)[is_ptr]
+        self.vals = words[is_ptr].astype(np.int64)
+        # Sorted by value
+        order = np.argsort(self.vals, kind="stable")
+        self._sorted_vals = self.vals[order]
+        self._sorted_locs = self.locs[order]
+
+    def __len__(self) -> int:
+        return len(self.locs)
+
+    def __contains__(self, loc: int) -> bool:
+        return self.get_val(loc) is not None
+
+    def get_val(self, loc: int) -> Optional[int]:
+        """Returns the pointer value at the location, or None if not a pointer."""
+        i = np.searchsorted(self.locs, loc)
+        if i < len(self.locs) and self.locs[i] == loc:
+            return int(self.vals[i])
+        return None
+
+    def has_locs(self, locs: np.ndarray) -> np.ndarray:
+        """Returns a mask of which locations contain a pointer."""
+        locs = np.asarray(locs, dtype=np.int64)
+        if len(self.locs) == 0:
+            return np.zeros(len(locs), dtype=bool)
+        i = np.searchsorted(self.locs, locs)
+        i[i == len(self.locs)] = 0
+        return self.locs[i] == locs
+
+    def locs_in(self, start: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (locations, values) of each pointer located in [start, end)."""
+        i = np.searchsorted(self.locs, start)
+        j = np.searchsorted(self.locs, end)
+        return self.locs[i:j], self.vals[i:j]
+
+    def find(self, val: int) -> np.ndarray:
+        """Returns the sorted locations of each pointer with the value."""
+        i = np.searchsorted(self._sorted_vals, val)
+        j = np.searchsorted(self._sorted_vals, val, "right")
+        return self._sorted_locs[i:j]
+
+    def find_range(self, start: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (locations, values) of each pointer with a value in [start, end)."""
+        i = np.searchsorted(self._sorted_vals, start)
+        j = np.searchsorted(self._sorted_vals, end)
+        return self._sorted_locs[i:j], self._sorted_vals[i:j]
+
+
+_INDEXES: weakref.WeakKeyDictionary[Rom, PointerIndex] = weakref.WeakKeyDictionary()
+
+
+def get_pointer_index(rom: Rom) -> PointerIndex:
+    """
+    Returns the pointer index of the ROM, building it on first use and
+    rebuilding it after the ROM is written to.
+    """
+    index = _INDEXES.get(rom)
+    if index is None or index.version != rom.version:
+        index = PointerIndex(rom)
+        _INDEXES[rom] = index
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    apu.add_arg(parser, apu.ArgType.ROM_PATH)
+    apu.add_arg(parser, apu.ArgType.ADDR)
+
+    args = parser.parse_args()
+    rom = apu.get_rom(args.rom_path)
+    addr = apu.get_hex(args.addr)
+    if addr < ROM_OFFSET:
+        addr += ROM_OFFSET
+
+    index = get_pointer_index(rom)
+    for loc in index.find(addr).tolist():
+        print(f"{loc:X}")
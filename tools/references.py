@@ -1,15 +1,17 @@
 import argparse
 from enum import Enum
-from typing import Any
+from typing import Any, Optional
 
+import numpy as np
 import yaml
 
+from analysis_cache import get_analysis
 import argparse_utils as apu
-from function import all_functions
+from constants import MAP_CODE, MAP_DATA
 from info.game_info import GameInfo, InfoSource
-from info.info_entry import InfoEntry, CodeEntry, DataEntry
+from info.info_entry import CodeEntry, DataEntry
+from pointer_index import get_pointer_index
 from rom import Rom, SIZE_32MB, ROM_OFFSET, ROM_END
-from thumb import ThumbForm, ThumbInstruct
 
 
 class RefType(Enum):
@@ -163,35 +165,52 @@ class References(object):
         data_refs = []
 
         # Check bl and ldr in code
-        self.entries = self.info.code
+        self.index = self.info.get_index(MAP_CODE)
         addr_val = addr
         if in_rom:
             addr_val += ROM_OFFSET
             if in_code:
                 addr_val += 1
-        for i in range(code_start, code_end, 2):
-            inst = ThumbInstruct(rom, i)
-            if inst.format == ThumbForm.LdPC:
-                pool_addr = inst.pc_rel_addr()
-                val = rom.read_32(pool_addr)
-                if addr_val == val:
-                    ref = pool_refs.get(pool_addr)
-                    if ref is None:
-                        ref = self.get_ref(pool_addr, RefType.POOL)
-                        pool_refs[pool_addr] = ref
-                    ref.ldrs.append(i)
-            elif in_code and inst.format == ThumbForm.Link:
-                if addr == inst.branch_addr():
-                    ref = self.get_ref(i, RefType.BL)
-                    bl_refs.append(ref)
+        # Find every word equal to the address value
+        v_code_start = rom.code_start(True)
+        v_data_end = rom.data_end(True)
+        if addr_val >= v_code_start and addr_val < v_data_end:
+            matches = get_pointer_index(rom).find(addr_val)
+        else:
+            num_words = len(range(code_start, data_end, 4))
+            words = rom.read_u32_array(code_start, num_words)
+            matches = np.arange(code_start, data_end, 4)[words == addr_val]
+
+        # Get every halfword in code (plus one for the second half of a bl)
+        num_halves = (code_end - code_start) // 2
+        halves = rom.read_u16_array(code_start, num_halves + 1).astype(np.int64)
+        locs = np.arange(code_start, code_end, 2)
+        # ldr Rd,=Word
+        is_ldr = (halves[:-1] >> 11) == 0b01001
+        ldr_locs = locs[is_ldr]
+        pool_addrs = ((ldr_locs + 4) & ~2) + (halves[:-1][is_ldr] & 0xFF) * 4
+        is_match = np.isin(pool_addrs, matches)
+        for i, pool_addr in zip(ldr_locs[is_match].tolist(), pool_addrs[is_match].tolist()):
+            ref = pool_refs.get(pool_addr)
+            if ref is None:
+                ref = self.get_ref(pool_addr, RefType.POOL)
+                pool_refs[pool_addr] = ref
+            ref.ldrs.append(i)
+        if in_code:
+            # bl label
+            is_bl = (halves[:-1] >> 12) == 0xF
+            off = ((halves[:-1] & 0x7FF) << 11) | (halves[1:] & 0x7FF)
+            off -= (off & 0x200000) << 1
+            is_match = is_bl & (locs + 4 + off * 2 == addr)
+            for i in locs[is_match].tolist():
+                ref = self.get_ref(i, RefType.BL)
+                bl_refs.append(ref)
 
         # Check data
-        self.entries = self.info.data
-        for i in range(code_end, data_end, 4):
-            val = rom.read_32(i)
-            if addr_val == val:
-                ref = self.get_ref(i, RefType.DATA)
-                data_refs.append(ref)
+        self.index = self.info.get_index(MAP_DATA)
+        for i in matches[matches >= code_end].tolist():
+            ref = self.get_ref(i, RefType.DATA)
+            data_refs.append(ref)
         
         return bl_refs, list(pool_refs.values()), data_refs
 
@@ -202,27 +221,23 @@ class References(object):
         rom = self.rom
 
         # Check every ref in code
-        self.entries = self.info.code
-        for func in all_functions(rom):
-            # Check for bl
-            for addr, inst in func.instructs.items():
-                if inst.format != ThumbForm.Link:
-                    continue
-                bl_addr = inst.branch_addr()
-                if bl_addr >= func.start_addr and bl_addr < func.end_addr:
-                    continue
-                self.add_ref(bl_addr, addr, RefType.BL)
-            # Check for pool
-            for addr in func.data_pool:
-                self.check_addr(addr, RefType.POOL)
+        self.index = self.info.get_index(MAP_CODE)
+        analysis = get_analysis(rom)
+        # Check for bl
+        bl_addrs, bl_targets = analysis.external_bls()
+        for addr, bl_addr in zip(bl_addrs.tolist(), bl_targets.tolist()):
+            self.add_ref(bl_addr, addr, RefType.BL)
+        # Check for pool
+        for addr in analysis.pool_addrs.tolist():
+            self.check_addr(addr, RefType.POOL)
 
         # Check every ref in data
-        self.entries = self.info.data
+        self.index = self.info.get_index(MAP_DATA)
         data_start = rom.data_start()
         data_end = rom.data_end()
-        self.entries.append(DataEntry(None, None, "u8", 1, data_end))
-        for i in range(data_start, data_end, 4):
-            self.check_addr(i, RefType.DATA)
+        locs, vals = get_pointer_index(rom).locs_in(data_start, data_end)
+        for i, val in zip(locs.tolist(), vals.tolist()):
+            self.add_ptr_ref(val, i, RefType.DATA)
         
         # Get all code and data names
         entry_names = {}
@@ -238,11 +253,15 @@ class References(object):
         """Checks if an address contains a valid reference."""
         val = self.rom.read_32(addr)
         if val >= self.rom.code_start(True) and val < self.rom.data_end(True):
-            val -= ROM_OFFSET
-            if val < self.rom.code_end() and val % 4 == 1:
-                # Subtract one for thumb code pointers
-                val -= 1
-            self.add_ref(val, addr, kind)
+            self.add_ptr_ref(val, addr, kind)
+
+    def add_ptr_ref(self, val: int, addr: int, kind: RefType) -> None:
+        """Creates and adds the reference for a pointer at the given address."""
+        val -= ROM_OFFSET
+        if val < self.rom.code_end() and val % 4 == 1:
+            # Subtract one for thumb code pointers
+            val -= 1
+        self.add_ref(val, addr, kind)
 
     def add_ref(self, val: int, addr: int, kind: RefType) -> None:
         """Creates and adds the reference at the given address."""
@@ -251,76 +270,37 @@ class References(object):
         ref = self.get_ref(addr, kind)
         self.found_refs[val].append(ref)
 
-    def get_prev_entry(self, addr: int) -> InfoEntry:
-        """Binary search to find the first entry <= addr"""
-        left = 0
-        right = len(self.entries) - 1
-        result = None
-        while left <= right:
-            mid = (left + right) // 2
-            if self.entries[mid].addr <= addr:
-                result = self.entries[mid]
-                left = mid + 1
-            else:
-                right = mid - 1
-        return result
-
     def get_ref(self, addr: int, kind: RefType) -> Ref:
-        # Get closest entry before address
-        entry = self.get_prev_entry(addr)
+        # Get entry containing address
+        found = self.index.find(addr)
         # Create reference based on type
         if kind == RefType.BL:
-            return self.get_bl_ref(addr, entry)
+            return self.get_bl_ref(addr, found)
         elif kind == RefType.POOL:
-            return self.get_pool_ref(addr, entry)
+            return self.get_pool_ref(addr, found)
         elif kind == RefType.DATA:
-            return self.get_data_ref(addr, entry)
+            return self.get_data_ref(addr, found)
         else:
             raise NotImplementedError()
 
-    def get_code_len(self, entry: CodeEntry) -> int:
-        if isinstance(entry.size, int):
-            return entry.size
-        else:
-            return entry.size[self.rom.region]
-    
-    def get_offset_within_entry(self, addr, entry_addr, entry_len) -> int:
-        assert entry_addr <= addr
-        offset = addr - entry_addr
-        if offset < entry_len:
-            return offset
-        return -1
-
-    def get_bl_ref(self, addr: int, entry: CodeEntry) -> BlRef:
-        if entry is not None:
-            length = self.get_code_len(entry)
-            offset = self.get_offset_within_entry(addr, entry.addr, length)
-            if offset != -1:
-                return BlRef(addr, entry.name, offset)
+    def get_bl_ref(self, addr: int, found: Optional[tuple[CodeEntry, int, int]]) -> BlRef:
+        if found is not None:
+            entry, _, offset = found
+            return BlRef(addr, entry.name, offset)
         return BlRef(addr)
     
-    def get_pool_ref(self, addr: int, entry: CodeEntry) -> PoolRef:
-        if entry is not None:
-            length = self.get_code_len(entry)
-            offset = self.get_offset_within_entry(addr, entry.addr, length)
-            if offset != -1:
-                return PoolRef(addr, [], entry.name, offset)
+    def get_pool_ref(self, addr: int, found: Optional[tuple[CodeEntry, int, int]]) -> PoolRef:
+        if found is not None:
+            entry, _, offset = found
+            return PoolRef(addr, [], entry.name, offset)
         return PoolRef(addr, [])
     
-    def get_data_ref(self, addr: int, entry: DataEntry) -> DataRef:
-        if entry is not None:
-            length = entry.get_size(self.info.sizes, self.info.types)
-            offset = self.get_offset_within_entry(addr, entry.addr, length)
-            if offset != -1:
-                count = entry.get_count()
-                idx = 0
-                if count > 1:
-                    size = length // count
-                    idx = offset // size
-                    offset %= size
-                return DataRef(addr, entry.name, idx, offset)
+    def get_data_ref(self, addr: int, found: Optional[tuple[DataEntry, int, int]]) -> DataRef:
+        if found is not None:
+            entry, idx, offset = found
+            return DataRef(addr, entry.name, idx, offset)
         return DataRef(addr)
-    
+
 
 def output_section(refs: list[Ref], title: str, fields: list[str]) -> list[str]:
     lines = []
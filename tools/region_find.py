@@ -2,7 +2,10 @@ import argparse
 from collections import defaultdict
 from enum import Enum, auto
 
+import numpy as np
+
 import argparse_utils as apu
+from pointer_index import get_pointer_index
 from rom import Rom, ROM_OFFSET
 
 
@@ -23,32 +26,23 @@ class PtrReplacement(Enum):
 
 
 def replace_ptrs_count(rom: Rom):
-    start = rom.code_start()
-    end = rom.data_end()
-    rom_start = start + ROM_OFFSET
-    rom_end = end + ROM_OFFSET
+    locs = get_pointer_index(rom).locs
+    # Get count of pointers before each pointer in the same run
+    idx = np.arange(len(locs))
+    run_start = np.ones(len(locs), dtype=bool)
+    run_start[1:] = locs[1:] != locs[:-1] + 4
+    ptr_count = idx - np.maximum.accumulate(np.where(run_start, idx, 0))
+    # Replace pointer with "ptr" and count
     data = bytearray(rom.data)
-    ptr_count = 0
-    for i in range(start, end, 4):
-        val = rom.read_32(i)
-        if val >= rom_start and val < rom_end:
-            # Replace pointer with "ptr" and count
-            data[i] = 0x70
-            data[i + 1] = 0x74
-            data[i + 2] = 0x72
-            data[i + 3] = ptr_count & 0xFF
-            ptr_count += 1
-        else:
-            ptr_count = 0
-    rom.data = data
+    words = np.ndarray((len(data) // 4,), "<u4", data)
+    words[locs // 4] = 0x727470 | ((ptr_count & 0xFF) << 24)
+    rom.write_bytes(0, data)
 
 
 def replace_ptrs_value(rom: Rom):
-    start = rom.code_start()
-    end = rom.data_end()
-    rom_start = start + ROM_OFFSET
-    rom_end = end + ROM_OFFSET
-    for i in range(start, end, 4):
+    rom_start = rom.code_start(True)
+    rom_end = rom.data_end(True)
+    for i in get_pointer_index(rom).locs.tolist():
         addr = i
         val = rom.read_32(i)
         while val >= rom_start and val < rom_end:
@@ -1,9 +1,12 @@
+import mmap
 from typing import Optional, Union
 
+import numpy as np
+
 from constants import *
 
 
-BytesLike = Union[bytes, bytearray]
+BytesLike = Union[bytes, bytearray, memoryview]
 
 SIZE_8MB = 0x80_0000
 SIZE_16MB = SIZE_8MB * 2
@@ -15,10 +18,30 @@ ROM_END = ROM_OFFSET + SIZE_32MB
 
 class Rom(object):
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, mapped: bool = False):
         # Read file
+        self.mapped = mapped
         with open(path, "rb") as f:
-            self.data = bytearray(f.read())
+            if mapped:
+                # Map file as copy-on-write; pages are shared between
+                # processes until written to, and writes never reach the file
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            else:
+                self.data = bytearray(f.read())
+        self.version = 0
+        self._identify()
+
+    @classmethod
+    def from_buffer(cls, data: BytesLike) -> "Rom":
+        """Creates a ROM that reads from an existing buffer without copying it."""
+        rom = cls.__new__(cls)
+        rom.mapped = True
+        rom.data = data
+        rom.version = 0
+        rom._identify()
+        return rom
+
+    def _identify(self) -> None:
         # Check title and code
         title = self.read_ascii(0xA0, 0x10)
         if title == "METROID4USA\0AMTE":
@@ -75,23 +98,51 @@ class Rom(object):
             raise ValueError(f"Invalid pointer {val:X} at {addr:X}")
         return val - ROM_OFFSET
 
-    def read_bytes(self, addr: int, size: int) -> bytearray:
+    def read_bytes(self, addr: int, size: int) -> BytesLike:
+        """
+        Returns a copy of the bytes at the address, or a zero-copy view
+        if the ROM is memory-mapped.
+        """
         end = addr + size
+        if self.mapped:
+            return memoryview(self.data)[addr:end]
         return self.data[addr:end]
 
+    def read_u16_array(self, addr: int, count: int, step: int = 2) -> np.ndarray:
+        """
+        Returns a zero-copy view of count 16-bit values starting at the
+        address. Values are step bytes apart, so a step of 1 gives a
+        value at every (unaligned) byte offset.
+        """
+        return np.ndarray((count,), "<u2", self.data, addr, (step,))
+
+    def read_u32_array(self, addr: int, count: int, step: int = 4) -> np.ndarray:
+        """
+        Returns a zero-copy view of count 32-bit values starting at the
+        address. Values are step bytes apart, so a step of 1 or 2 gives
+        overlapping (unaligned) values.
+        """
+        return np.ndarray((count,), "<u4", self.data, addr, (step,))
+
     def read_ascii(self, addr: int, size: int) -> str:
-        return self.read_bytes(addr, size).decode("ascii")
+        return str(self.read_bytes(addr, size), "ascii")
     
     def read_sjis(self, addr: int, size: int) -> str:
-        return self.read_bytes(addr, size).decode("shift_jis")
+        return str(self.read_bytes(addr, size), "shift_jis")
+
+    # Each write increments version, so per-ROM caches (pointer index,
+    # decompressed data, palettes) can tell when they're stale. Writes that
+    # don't use these methods aren't tracked.
 
     def write_8(self, addr: int, val: int) -> None:
         self.data[addr] = val
+        self.version += 1
 
     def write_16(self, addr: int, val: int) -> None:
         val &= 0xFFFF
         self.data[addr] = val & 0xFF
         self.data[addr + 1] = val >> 8
+        self.version += 1
 
     def write_32(self, addr: int, val: int) -> None:
         val &= 0xFFFFFFFF
@@ -99,6 +150,7 @@ class Rom(object):
         self.data[addr + 1] = (val >> 8) & 0xFF
         self.data[addr + 2] = (val >> 16) & 0xFF
         self.data[addr + 3] = val >> 24
+        self.version += 1
 
     def write_ptr(self, addr: int, val: int) -> None:
         assert val < ROM_OFFSET, f"Pointer should be less than {ROM_OFFSET:X} but is {val:X}"
@@ -116,6 +168,7 @@ class Rom(object):
         dst_end = dst_addr + size
         src_end = src_addr + size
         self.data[dst_addr:dst_end] = vals[src_addr:src_end]
+        self.version += 1
 
     def seek(self, addr: int) -> None:
         assert 0 <= addr < len(self.data)
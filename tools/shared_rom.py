@@ -0,0 +1,48 @@
+from multiprocessing import shared_memory
+from typing import Optional
+
+from rom import Rom
+
+
+class SharedRom(object):
+    """
+    Copy of a ROM's bytes in shared memory, which worker processes can read
+    without each loading or pickling the ROM.
+    """
+
+    def __init__(self, rom: Rom):
+        self.size = len(rom.data)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.size)
+        self.shm.buf[:self.size] = rom.data
+
+    def __enter__(self) -> "SharedRom":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def init_args(self) -> tuple[str, int]:
+        """Returns the arguments to pass to init_worker."""
+        return self.shm.name, self.size
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_rom: Optional[Rom] = None
+
+
+def init_worker(name: str, size: int) -> None:
+    """Attaches a worker process to a SharedRom. Use as a pool initializer."""
+    global _worker_shm, _worker_rom
+    _worker_shm = shared_memory.SharedMemory(name=name)
+    _worker_rom = Rom.from_buffer(_worker_shm.buf[:size])
+
+
+def worker_rom() -> Rom:
+    """Returns the ROM of the current worker process."""
+    if _worker_rom is None:
+        raise RuntimeError("Worker is not attached to a shared ROM")
+    return _worker_rom
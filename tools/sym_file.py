@@ -1,8 +1,9 @@
 import argparse
 
+from analysis_cache import get_analysis
 import argparse_utils as apu
 from constants import MAP_CODE, MAP_DATA, MAP_RAM
-from function import all_functions
+from function import pool_ranges
 from info.game_info import GameInfo
 from info.info_entry import DataEntry, CodeEntry
 from info.info_file_utils import get_info_file_from_json
@@ -14,10 +15,11 @@ def gen_sym_file(rom: Rom) -> list[str]:
     func_addrs = []
     loaded_words = set()
     pool_sizes = []
-    funcs = all_functions(rom)
-    for func in funcs:
-        func_addrs.append(func.start_addr)
-        func_pools = func.get_data_pools()
+    analysis = get_analysis(rom)
+    for i in range(len(analysis)):
+        func_addrs.append(int(analysis.func_starts[i]))
+        all_words = analysis.func_pools(i).tolist() + analysis.func_jumps(i).tolist()
+        func_pools = pool_ranges(all_words)
         if len(func_pools) > 0:
             pool_sizes += func_pools
             for offset, size in func_pools:
@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from typing import Optional
 
 from rom import Rom, ROM_OFFSET
 
@@ -97,6 +98,13 @@ class Reg(object):
     PC = 15
 
 
+DecodedFields = tuple[
+    ThumbForm, int, ThumbOp, Optional[int], Optional[int],
+    Optional[int], Optional[int], Optional[tuple[int, ...]], Optional[int]
+]
+"""(format, opcode, opname, rd, rs, rn, ro, rlist, imm) of a halfword."""
+
+
 class ThumbInstruct(object):
 
     # phys_addr: int
@@ -107,25 +115,48 @@ class ThumbInstruct(object):
     # rs: int
     # rn: int
     # ro: int
-    # rlist: list[int]
+    # rlist: tuple[int, ...] (shared between instructions, don't modify)
     # imm: int
 
+    # No instance dictionary, since functions keep every instruction
+    __slots__ = (
+        "phys_addr", "format", "opcode", "opname", "rd",
+        "rs", "rn", "ro", "rlist", "imm"
+    )
+
     def __init__(self, rom: Rom, addr: int):
         self.phys_addr = addr
         val = rom.read_16(addr)
-        self.set_format(val)
-        self.set_opcode(val)
-        self.set_rd(val)
-        self.set_rs(val)
-        self.set_rn(val)
-        self.set_ro(val)
-        self.set_rlist(val)
+        (
+            self.format, self.opcode, self.opname, self.rd, self.rs,
+            self.rn, self.ro, self.rlist, self.imm
+        ) = decode(val)
         if self.format == ThumbForm.Link:
             val2 = rom.read_16(addr + 2)
             self.imm = ((val & 2047) << 11) | (val2 & 2047)
+
+    @classmethod
+    def decode_fields(cls, val: int) -> "DecodedFields":
+        """Decodes a halfword without using the decode table."""
+        inst = cls.__new__(cls)
+        inst.set_format(val)
+        inst.set_opcode(val)
+        inst.set_rd(val)
+        inst.set_rs(val)
+        inst.set_rn(val)
+        inst.set_ro(val)
+        inst.set_rlist(val)
+        if inst.format == ThumbForm.Link:
+            # Set in constructor
+            inst.imm = None
         else:
-            self.set_imm(val)
-        self.set_opname()
+            inst.set_imm(val)
+        inst.set_opname()
+        rlist = None if inst.rlist is None else tuple(inst.rlist)
+        return (
+            inst.format, inst.opcode, inst.opname, inst.rd, inst.rs,
+            inst.rn, inst.ro, rlist, inst.imm
+        )
 
     def __str__(self) -> str:
         fields = [
@@ -494,3 +525,16 @@ class ThumbInstruct(object):
             else:
                 raise ValueError()
         return regs
+
+
+_DECODE_TABLE: list[Optional[DecodedFields]] = [None] * 0x10000
+"""Decoded fields of every halfword, filled in as each is first decoded."""
+
+
+def decode(val: int) -> DecodedFields:
+    """Returns the decoded fields of a halfword using the decode table."""
+    fields = _DECODE_TABLE[val]
+    if fields is None:
+        fields = ThumbInstruct.decode_fields(val)
+        _DECODE_TABLE[val] = fields
+    return fields
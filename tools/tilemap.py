@@ -0,0 +1,322 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+from typing import Optional
+
+import numpy as np
+import png
+
+import argparse_utils as apu
+from decomp_cache import decompress
+from gfx import Gfx, Palette, get_palette
+from info.asset_type import TypeSpecKind
+from info.game_info import GameInfo
+from info.info_entry import Compression
+from rom import Rom
+from shared_rom import SharedRom, init_worker, worker_rom
+
+
+TILE_MASK = 0x3FF
+H_FLIP = 0x400
+V_FLIP = 0x800
+PAL_SHIFT = 12
+
+ROOM_ENTRY_SIZE = 0x3C
+"""Size of a room entry in ROM. BG properties start at 1 and BG data
+pointers start at 8, one for each of BG0 to BG2."""
+
+BG_PROP_RLE = 0x10
+"""BG property flag for RLE compressed block backgrounds."""
+
+TILESET_ENTRY_SIZE = 0x14
+"""Size of a tileset entry. Graphics, palette, and tilemap pointers are at
+0, 4, and 0xC."""
+
+TILESET_PAL_ROW = 1
+"""Palette row the tileset's palette is loaded to."""
+
+RoomBg = tuple[str, int, int]
+"""Output name, block background address, and tileset number."""
+
+TilesetArgs = tuple[int, int, int, int, Optional[int]]
+"""Graphics address, palette address, palette rows, tilemap address, and
+number of blocks (None if unknown)."""
+
+
+class TileAtlas(object):
+    """
+    Renders 8x8 tiles for tilemap entries, where each combination of tile,
+    flip bits, and palette row is only rendered once. If transparent, tiles
+    are RGBA and color 0 of each row is fully transparent.
+    """
+
+    def __init__(self,
+        gfx: Gfx,
+        palette: Palette,
+        tile_offset: int = 0,
+        transparent: bool = False
+    ):
+        # (tile, y, x) color index of every tile
+        tile_rows = gfx.get_pixels().reshape(-1, 8, gfx.tile_width, 8)
+        tiles = tile_rows.transpose(0, 2, 1, 3).reshape(-1, 8, 8)
+        self.tiles = tiles[:gfx.get_num_tiles()]
+        # (row, index) color of each palette row
+        num_rows = len(palette.colors) // 16
+        colors = palette.to_array()[:num_rows * 16].reshape(num_rows, 16, 3)
+        if transparent:
+            alpha = np.full((num_rows, 16, 1), 0xFF, dtype=np.uint8)
+            alpha[:, 0] = 0
+            colors = np.concatenate((colors, alpha), axis=2)
+        self.colors = colors
+        self.channels = colors.shape[2]
+        self.tile_offset = tile_offset
+        self.rendered: dict[int, np.ndarray] = {}
+
+    def render(self, entry: int) -> np.ndarray:
+        """Returns the (8, 8, channels) image of a tilemap entry."""
+        image = self.rendered.get(entry)
+        if image is not None:
+            return image
+        tile = (entry & TILE_MASK) - self.tile_offset
+        row = entry >> PAL_SHIFT
+        if 0 <= tile < len(self.tiles) and row < len(self.colors):
+            image = self.colors[row][self.tiles[tile]]
+            if entry & H_FLIP:
+                image = image[:, ::-1]
+            if entry & V_FLIP:
+                image = image[::-1]
+            image = np.ascontiguousarray(image)
+        else:
+            # Tile or palette row isn't loaded
+            image = np.zeros((8, 8, self.channels), dtype=np.uint8)
+        self.rendered[entry] = image
+        return image
+
+    def render_tilemap(self, entries: np.ndarray) -> np.ndarray:
+        """
+        Returns the (height, width, channels) image of a 2D array of tilemap
+        entries.
+        """
+        height, width = entries.shape
+        unique, inverse = np.unique(entries, return_inverse=True)
+        tiles = np.stack([self.render(e) for e in unique.tolist()])
+        # (y tile, x tile, y, x) -> (y tile, y, x tile, x)
+        image = tiles[inverse.reshape(height, width)].transpose(0, 2, 1, 3, 4)
+        return image.reshape(height * 8, width * 8, self.channels)
+
+
+def read_tilemap(rom: Rom, addr: int, width: int, height: int) -> np.ndarray:
+    """Returns a 2D array of tilemap entries."""
+    return rom.read_u16_array(addr, width * height).reshape(height, width)
+
+
+def read_block_bg(rom: Rom, addr: int) -> np.ndarray:
+    """Returns a 2D array of block numbers from RLE compressed BG data."""
+    width = rom.read_8(addr)
+    height = rom.read_8(addr + 1)
+    data, _ = decompress(rom, addr + 2, Compression.RLE)
+    if len(data) != width * height * 2:
+        raise ValueError("Decompressed data length does not match dimensions")
+    return np.frombuffer(data, "<u2").reshape(height, width)
+
+
+def read_block_tiles(rom: Rom, addr: int, num_blocks: int) -> np.ndarray:
+    """
+    Returns the 4 tilemap entries (top left, top right, bottom left, bottom
+    right) of each block in a tileset's tilemap, after its 2 byte header.
+    """
+    return rom.read_u16_array(addr + 2, num_blocks * 4).reshape(num_blocks, 4)
+
+
+def blocks_to_tilemap(blocks: np.ndarray, block_tiles: np.ndarray) -> np.ndarray:
+    """Converts a 2D array of 16x16 blocks to a 2D array of tilemap entries."""
+    height, width = blocks.shape
+    # Blocks past the end of the tileset are blank
+    blocks = np.where(blocks < len(block_tiles), blocks, 0)
+    entries = block_tiles[blocks].reshape(height, width, 2, 2)
+    return entries.transpose(0, 2, 1, 3).reshape(height * 2, width * 2)
+
+
+def to_png(image: np.ndarray) -> png.Image:
+    height, width, channels = image.shape
+    mode = "RGBA" if channels == 4 else "RGB"
+    return png.from_array(image.reshape(height, width * channels), mode)
+
+
+def get_room_bgs(rom: Rom, info: GameInfo) -> list[RoomBg]:
+    """Returns the block backgrounds of every room in every area."""
+    room_bgs: list[RoomBg] = []
+    for entry in info.data:
+        if (not entry.name.endswith("RoomEntries") or
+            entry.spec_kind() != TypeSpecKind.STRUCT or entry.arr_count is None):
+            continue
+        area = entry.name[1:-len("RoomEntries")]
+        for room in range(entry.arr_count):
+            addr = entry.addr + room * ROOM_ENTRY_SIZE
+            tileset = rom.read_8(addr)
+            for bg in range(3):
+                if rom.read_8(addr + 1 + bg) & BG_PROP_RLE == 0:
+                    continue
+                try:
+                    bg_addr = rom.read_ptr(addr + 8 + bg * 4)
+                except ValueError:
+                    continue
+                room_bgs.append((f"{area}_{room:02X}_Bg{bg}", bg_addr, tileset))
+    return room_bgs
+
+
+def get_tilesets(rom: Rom, info: GameInfo) -> dict[int, TilesetArgs]:
+    """Returns the graphics, palette, and tilemap of every tileset."""
+    table = info.get_data("sTilesetEntries")
+    tilesets: dict[int, TilesetArgs] = {}
+    if table is None:
+        return tilesets
+    for num in range(table.arr_count):
+        addr = table.addr + num * TILESET_ENTRY_SIZE
+        try:
+            gfx_addr = rom.read_ptr(addr)
+            pal_addr = rom.read_ptr(addr + 4)
+            map_addr = rom.read_ptr(addr + 0xC)
+        except ValueError:
+            continue
+        # Use the sizes of the palette and tilemap entries if known
+        rows = 16 - TILESET_PAL_ROW
+        pal = info.get_entry_by_addr(pal_addr)
+        if pal is not None:
+            rows = min(rows, max(1, pal.get_size(info.sizes, info.types) // 32))
+        num_blocks = None
+        tilemap = info.get_entry_by_addr(map_addr)
+        if tilemap is not None:
+            num_blocks = (tilemap.get_size(info.sizes, info.types) - 2) // 8
+        tilesets[num] = (gfx_addr, pal_addr, rows, map_addr, num_blocks)
+    return tilesets
+
+
+def get_tileset_atlas(rom: Rom, tileset: TilesetArgs, tile_offset: int) -> TileAtlas:
+    gfx_addr, pal_addr, rows, _, _ = tileset
+    data, _ = decompress(rom, gfx_addr, Compression.LZ)
+    palette = Palette(TILESET_PAL_ROW + rows)
+    start = TILESET_PAL_ROW * 16
+    palette.colors[start:] = get_palette(rom, pal_addr, rows).colors
+    return TileAtlas(Gfx(data), palette, tile_offset, True)
+
+
+def _export_rooms(
+    rom: Rom,
+    room_bgs: list[RoomBg],
+    tileset: TilesetArgs,
+    tile_offset: int,
+    out_dir: str
+) -> int:
+    """Writes the backgrounds of rooms with the same tileset."""
+    try:
+        atlas = get_tileset_atlas(rom, tileset, tile_offset)
+    except (ValueError, IndexError):
+        print(f"Invalid tileset for {room_bgs[0][0]}")
+        return 0
+    _, _, _, map_addr, num_blocks = tileset
+    written = 0
+    for name, bg_addr, _ in room_bgs:
+        try:
+            blocks = read_block_bg(rom, bg_addr)
+            count = num_blocks if num_blocks is not None else int(blocks.max()) + 1
+            block_tiles = read_block_tiles(rom, map_addr, count)
+        except (ValueError, IndexError):
+            print(f"Invalid background: {name}")
+            continue
+        image = atlas.render_tilemap(blocks_to_tilemap(blocks, block_tiles))
+        to_png(image).save(os.path.join(out_dir, name + ".png"))
+        written += 1
+    return written
+
+
+def _export_rooms_in_worker(
+    room_bgs: list[RoomBg],
+    tileset: TilesetArgs,
+    tile_offset: int,
+    out_dir: str
+) -> int:
+    # Runs in a worker process
+    return _export_rooms(worker_rom(), room_bgs, tileset, tile_offset, out_dir)
+
+
+def export_all(rom: Rom, out_dir: str, tile_offset: int = 0, jobs: int = 1) -> None:
+    """Writes a png file for every block background of every room."""
+    info = GameInfo(rom.game, rom.region)
+    tilesets = get_tilesets(rom, info)
+    # Group backgrounds by tileset so each atlas is built once
+    groups: dict[int, list[RoomBg]] = {}
+    for room_bg in get_room_bgs(rom, info):
+        if room_bg[2] not in tilesets:
+            print(f"Invalid tileset for {room_bg[0]}")
+            continue
+        groups.setdefault(room_bg[2], []).append(room_bg)
+    os.makedirs(out_dir, exist_ok=True)
+    if jobs <= 1:
+        written = sum(
+            _export_rooms(rom, room_bgs, tilesets[num], tile_offset, out_dir)
+            for num, room_bgs in groups.items()
+        )
+    else:
+        with SharedRom(rom) as shared:
+            with ProcessPoolExecutor(
+                jobs, initializer=init_worker, initargs=shared.init_args()
+            ) as executor:
+                written = sum(executor.map(
+                    _export_rooms_in_worker,
+                    groups.values(),
+                    [tilesets[num] for num in groups],
+                    [tile_offset] * len(groups),
+                    [out_dir] * len(groups)
+                ))
+    print(f"Wrote {written} backgrounds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    apu.add_arg(parser, apu.ArgType.ROM_PATH)
+    parser.add_argument("path", type=str,
+        help="Output path for png file (or directory with --all)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    apu.add_arg(group, apu.ArgType.ADDR, "-m", "--map")
+    apu.add_arg(group, apu.ArgType.ADDR, "-b", "--blocks")
+    group.add_argument("--all", action="store_true",
+        help="Export the block backgrounds of every room")
+    parser.add_argument("-w", "--width", type=int, default=32,
+        help="Width of tilemap in tiles (--map only)")
+    parser.add_argument("--height", type=int, default=32,
+        help="Height of tilemap in tiles (--map only)")
+    apu.add_arg(parser, apu.ArgType.ADDR, "-t", "--tileset")
+    apu.add_arg(parser, apu.ArgType.ADDR, "-g", "--gfx")
+    parser.add_argument("-s", "--size", type=str,
+        help="Size of uncompressed graphics (compressed if not provided)")
+    apu.add_arg(parser, apu.ArgType.ADDR, "-p", "--palette")
+    parser.add_argument("-r", "--rows", type=int, default=16,
+        help="Number of palette rows")
+    parser.add_argument("-o", "--tile_offset", type=str, default="0",
+        help="Tile number of the first graphics tile")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="Number of worker processes (--all only)")
+
+    args = parser.parse_args()
+    rom = apu.get_rom(args.rom_path)
+    if args.all:
+        export_all(rom, args.path, apu.get_hex(args.tile_offset), args.jobs)
+    else:
+        if args.gfx is None or args.palette is None:
+            parser.error("--gfx and --palette are required")
+        size = int(args.size, 16) if args.size else None
+        gfx = Gfx.from_rom(rom, apu.get_hex(args.gfx), size)
+        palette = get_palette(rom, apu.get_hex(args.palette), args.rows)
+        atlas = TileAtlas(gfx, palette, apu.get_hex(args.tile_offset))
+
+        if args.map:
+            entries = read_tilemap(rom, apu.get_hex(args.map), args.width, args.height)
+        else:
+            if args.tileset is None:
+                parser.error("--tileset is required with --blocks")
+            blocks = read_block_bg(rom, apu.get_hex(args.blocks))
+            num_blocks = int(blocks.max()) + 1
+            block_tiles = read_block_tiles(rom, apu.get_hex(args.tileset), num_blocks)
+            entries = blocks_to_tilemap(blocks, block_tiles)
+        to_png(atlas.render_tilemap(entries)).save(args.path)
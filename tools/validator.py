@@ -12,6 +12,7 @@ from info.asset_type import AssetType, OuterType, PointerType, FunctionType
 from info.game_info import GameInfo, InfoSource
 from info.info_entry import *
 import info.info_file_utils as ifu
+from info.info_snapshot import write_snapshot
 
 
 SCHEMA_PATH = "../schema"
@@ -164,31 +165,26 @@ class Validator(object):
         map_type: str
     ) -> None:
         self.entry_loc.field_name = K_ADDR
+        # Types don't vary by region, so any region of the entry will do
+        region = ALL_REGIONS[0]
+        if isinstance(entry.addr, dict):
+            region = next(iter(entry.addr))
+        error = self.info.get_index(map_type, region=region).get_error(entry)
+        if error is not None:
+            self.add_error(error)
+            return
         if prev is None:
             return
-        # Get current address
-        curr_addr = entry.addr
-        if isinstance(curr_addr, int):
-            curr_addr = {r: curr_addr for r in ALL_REGIONS}
-        # Get end of previous
-        prev_addr = prev.addr
-        if isinstance(prev_addr, int):
-            prev_addr = {r: prev_addr for r in ALL_REGIONS}
-        prev_len = None
-        if map_type == MAP_CODE:
-            prev_len = prev.size
-        else:
-            prev_len = prev.get_size(self.info.sizes, self.info.types)
-        if isinstance(prev_len, int):
-            prev_len = {r: prev_len for r in ALL_REGIONS}
-        prev_end = {
-            r: paddr + prev_len[r] - 1
-            for r, paddr in prev_addr.items()
-        }
+        regions = ALL_REGIONS
+        if isinstance(prev.addr, dict):
+            regions = prev.addr.keys()
         # Compare
-        for r, a in prev_end.items():
-            if r in curr_addr:
-                if a >= curr_addr[r]:
+        for r in regions:
+            index = self.info.get_index(map_type, region=r)
+            prev_span = index.span(prev)
+            curr_span = index.span(entry)
+            if prev_span is not None and curr_span is not None:
+                if prev_span[1] > curr_span[0]:
                     self.add_error(f"{map_type} entries overlap\n{prev.name}")
                 # Some data is in a different order in different regions,
                 # so we only check against one region
@@ -305,7 +301,8 @@ def output_jsons() -> None:
             p = os.path.join(json_dir, map_type + JSON_EXT)
             with open(p, "w") as f:
                 json.dump(obj, f, ensure_ascii=False)
-    print("Output JSON files")
+        write_snapshot(game)
+    print("Output JSON files and snapshots")
 
 
 if __name__ == "__main__":